@@ -0,0 +1,136 @@
+"""Análises de fluxo de caixa por conta, calculadas em uma única passada
+
+As séries são diárias, do primeiro ao último dia com transações da conta, e
+usam janelas deslizantes: cada dia soma o valor que entra na janela e
+subtrai o que sai, sem recalcular a janela inteira. Com NumPy disponível as
+somas móveis são vetorizadas.
+
+O resultado fica em cache na própria conta (chave 'analise') e é descartado
+por dados.aplicar_transacoes sempre que novas transações são importadas.
+"""
+from datetime import timedelta
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+JANELA_MEDIA = 30
+JANELAS_FLUXO = (30, 90)
+
+
+def soma_movel(valores, janela):
+    """Soma dos últimos `janela` valores em cada posição da série"""
+    if np is not None:
+        acumulado = np.cumsum(np.asarray(valores, dtype=float))
+        resultado = acumulado.copy()
+        resultado[janela:] -= acumulado[:-janela]
+        return resultado.tolist()
+
+    resultado = []
+    soma = 0.0
+    for i, valor in enumerate(valores):
+        soma += valor
+        if i >= janela:
+            soma -= valores[i - janela]
+        resultado.append(soma)
+    return resultado
+
+
+def saldo_acumulado(valores):
+    """Saldo corrente (soma acumulada) da série"""
+    if np is not None:
+        return np.cumsum(np.asarray(valores, dtype=float)).tolist()
+
+    resultado = []
+    soma = 0.0
+    for valor in valores:
+        soma += valor
+        resultado.append(soma)
+    return resultado
+
+
+def media_movel(valores, janela):
+    """Média dos últimos `janela` valores (ou de todos, no início da série)"""
+    somas = soma_movel(valores, janela)
+    return [soma / min(i + 1, janela) for i, soma in enumerate(somas)]
+
+
+def series_diarias(cliente, conta_id):
+    """Agrupa as transações da conta por dia, em ordem de data
+
+    Retorna (dias, receitas, despesas) com um valor para cada dia do período,
+    inclusive os dias sem movimento. Só as posições da própria conta são
+    ordenadas, sem percorrer (nem construir) os índices do cliente.
+    """
+    transacoes = cliente['contas'][conta_id]['transactions']
+    dias, receitas, despesas = [], [], []
+
+    for pos in sorted(range(len(transacoes)), key=lambda pos: transacoes[pos]['date']):
+        data = transacoes[pos]['date']
+        dia = data.date() if hasattr(data, 'date') else data
+
+        # Preenche os dias sem movimento até o dia da transação
+        while dias and dias[-1] < dia:
+            dias.append(dias[-1] + timedelta(days=1))
+            receitas.append(0.0)
+            despesas.append(0.0)
+        if not dias:
+            dias.append(dia)
+            receitas.append(0.0)
+            despesas.append(0.0)
+
+        valor = transacoes[pos]['amount']
+        if valor > 0:
+            receitas[-1] += valor
+        else:
+            despesas[-1] -= valor
+
+    return dias, receitas, despesas
+
+
+def analisar_conta(cliente, conta_id):
+    """Calcula (ou retorna do cache) as séries de fluxo de caixa da conta"""
+    conta = cliente['contas'][conta_id]
+    if 'analise' in conta:
+        return conta['analise']
+
+    dias, receitas, despesas = series_diarias(cliente, conta_id)
+    liquido = [r - d for r, d in zip(receitas, despesas)]
+
+    # Exercícios arquivados entram como saldo de abertura (ver arquivo.py)
+    if liquido:
+        liquido[0] += sum(resumo['saldo'] for resumo in conta.get('arquivados', {}).values())
+    saldo = saldo_acumulado(liquido)
+
+    analise = {
+        'dias': dias,
+        'saldo': saldo,
+        'media_saldo': media_movel(saldo, JANELA_MEDIA)
+    }
+    for janela in JANELAS_FLUXO:
+        analise[f'receitas_{janela}'] = soma_movel(receitas, janela)
+        analise[f'despesas_{janela}'] = soma_movel(despesas, janela)
+
+    conta['analise'] = analise
+    return analise
+
+
+def resumo_fluxo(cliente):
+    """Retorna os valores mais recentes das séries de cada conta do cliente"""
+    resumo = {}
+    for conta_id in cliente.get('contas', {}):
+        analise = analisar_conta(cliente, conta_id)
+        if not analise['dias']:
+            continue
+
+        resumo[conta_id] = {
+            'dia': analise['dias'][-1],
+            'saldo': analise['saldo'][-1],
+            'media_saldo': analise['media_saldo'][-1]
+        }
+        for janela in JANELAS_FLUXO:
+            resumo[conta_id][f'receitas_{janela}'] = analise[f'receitas_{janela}'][-1]
+            resumo[conta_id][f'despesas_{janela}'] = analise[f'despesas_{janela}'][-1]
+
+    return resumo
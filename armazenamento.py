@@ -0,0 +1,120 @@
+"""Persistência da base de clientes em arquivo
+
+A interface e o serviço de ingestão gravam a mesma base. Cada gravação é
+feita sob uma trava (arquivo .lock ao lado da base) e só substitui o arquivo
+se ele ainda for o que quem grava carregou, comparando o mtime; caso
+contrário, ErroBaseAlterada é lançado e nada é gravado.
+"""
+import os
+import pickle
+import time
+from contextlib import contextmanager
+
+VERSAO_BASE = 1
+CACHES_CLIENTE = ('indices',)  # Reconstruídos sob demanda (ver dados.obter_indices)
+CACHES_CONTA = ('analise',)  # Recalculadas sob demanda (ver analise.analisar_conta)
+ESPERA_TRAVA = 10  # segundos aguardando outro processo terminar de gravar
+VALIDADE_TRAVA = 60  # trava mais antiga que isso foi abandonada por um processo interrompido
+
+
+class ErroBaseAlterada(Exception):
+    """A base foi gravada por outro processo depois de carregada"""
+
+
+def mtime_base(caminho):
+    """mtime (ns) do arquivo da base, ou 0 se ele ainda não existir"""
+    try:
+        return os.stat(caminho).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+@contextmanager
+def travar_base(caminho):
+    """Trava a base para gravação, aguardando a trava de outro processo"""
+    trava = f"{caminho}.lock"
+    limite = time.monotonic() + ESPERA_TRAVA
+    while True:
+        try:
+            os.close(os.open(trava, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.stat(trava).st_mtime > VALIDADE_TRAVA:
+                    os.remove(trava)
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() > limite:
+                raise TimeoutError(f"Base em uso por outro processo ({trava})")
+            time.sleep(0.05)
+
+    try:
+        yield
+    finally:
+        os.remove(trava)
+
+
+def carregar_base(caminho):
+    """Carrega a base salva, retornando (clientes, checkpoint da ingestão)
+
+    Se o arquivo ainda não existir, retorna uma base vazia.
+    """
+    if not os.path.exists(caminho):
+        return {}, {}
+
+    with open(caminho, 'rb') as file:
+        base = pickle.load(file)
+
+    # Bases gravadas por versões anteriores podem trazer caches desatualizados
+    clientes = base.get('clientes', {})
+    for cliente in clientes.values():
+        for chave in CACHES_CLIENTE:
+            cliente.pop(chave, None)
+        for conta in cliente.get('contas', {}).values():
+            for chave in CACHES_CONTA:
+                conta.pop(chave, None)
+
+    return clientes, base.get('ingestao', {})
+
+
+def sem_caches(clientes):
+    """Cópias rasas dos clientes e contas sem os dados derivados, que não são gravados"""
+    copias = {}
+    for cliente_id, cliente in clientes.items():
+        copia = {chave: valor for chave, valor in cliente.items() if chave not in CACHES_CLIENTE}
+        copia['contas'] = {
+            conta_id: {chave: valor for chave, valor in conta.items() if chave not in CACHES_CONTA}
+            for conta_id, conta in cliente.get('contas', {}).items()
+        }
+        copias[cliente_id] = copia
+    return copias
+
+
+def salvar_base(caminho, clientes, ingestao=None, mtime_esperado=None):
+    """Salva clientes e checkpoint da ingestão de forma atômica
+
+    Os dois são gravados no mesmo arquivo, substituído de uma vez com
+    os.replace, para que uma interrupção nunca deixe o checkpoint à frente
+    (ou atrás) dos dados que ele descreve.
+
+    Com mtime_esperado (ver mtime_base), lança ErroBaseAlterada se a base foi
+    gravada por outro processo desde então. Retorna o mtime da base gravada.
+    """
+    base = {
+        'versao': VERSAO_BASE,
+        'clientes': sem_caches(clientes),
+        'ingestao': ingestao or {}
+    }
+
+    with travar_base(caminho):
+        if mtime_esperado is not None and mtime_base(caminho) != mtime_esperado:
+            raise ErroBaseAlterada(f"A base {caminho} foi alterada por outro processo")
+
+        temporario = f"{caminho}.tmp"
+        with open(temporario, 'wb') as file:
+            pickle.dump(base, file, protocol=pickle.HIGHEST_PROTOCOL)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporario, caminho)
+        return mtime_base(caminho)
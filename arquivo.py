@@ -0,0 +1,312 @@
+"""Arquivo de exercícios encerrados em arquivos binários por coluna
+
+As transações de anos encerrados saem de conta['transactions'] e são
+gravadas em ordem de data em <base>.arquivo/<cliente>/<conta>/<ano>/, uma
+coluna por arquivo:
+
+    datas.bin       int64, segundos desde 01/01/0001 (datetime.toordinal)
+    valores.bin     float64
+    categorias.bin  int32, código na lista de categorias.json
+    memos.bin       textos UTF-8 concatenados
+    memos_pos.bin   int64, início de cada texto em memos.bin (n + 1 posições)
+
+Os arquivos são mapeados em memória (mmap) apenas quando as linhas são lidas
+(exportação XML, apêndice dos relatórios e API de consulta, ver
+entradas_arquivadas): em ordem de data, só as linhas do período pedido são
+lidas, à medida que são consumidas. Totais e consolidação mensal de cada ano ficam em
+conta['arquivados'][ano], para que balanço e relatórios não precisem ler as linhas.
+"""
+import bisect
+import heapq
+import json
+import mmap
+import os
+import shutil
+from array import array
+from datetime import datetime, timedelta
+from itertools import chain
+from operator import itemgetter
+
+import dados
+
+SEGUNDOS_DIA = 86400
+
+
+def pasta_arquivo(caminho_base):
+    """Pasta raiz do arquivo de uma base"""
+    return f"{caminho_base}.arquivo"
+
+
+def pasta_ano(pasta_raiz, cliente_id, conta_id, ano):
+    return os.path.join(pasta_raiz, str(cliente_id), str(conta_id), str(ano))
+
+
+def codificar_data(data):
+    if not isinstance(data, datetime):
+        data = datetime(data.year, data.month, data.day)
+    return data.toordinal() * SEGUNDOS_DIA + data.hour * 3600 + data.minute * 60 + data.second
+
+
+def decodificar_data(valor):
+    dias, segundos = divmod(valor, SEGUNDOS_DIA)
+    return datetime.fromordinal(dias) + timedelta(seconds=segundos)
+
+
+def resumir(transacoes, ano):
+    """Totais, categorias e consolidação mensal de um ano arquivado"""
+    resumo = dados.balanco_vazio()
+    dados.somar_ao_balanco(resumo, transacoes)
+
+    meses = {}
+    for trans in transacoes:
+        mes = trans['date'].strftime('%Y-%m')
+        if mes not in meses:
+            meses[mes] = {'receitas': 0, 'despesas': 0, 'saldo': 0}
+        valor = trans['amount']
+        if valor > 0:
+            meses[mes]['receitas'] += valor
+        else:
+            meses[mes]['despesas'] += abs(valor)
+        meses[mes]['saldo'] += valor
+
+    resumo.update({
+        'ano': ano,
+        'transacoes': len(transacoes),
+        'inicio': min(t['date'] for t in transacoes),
+        'fim': max(t['date'] for t in transacoes),
+        'meses': dict(sorted(meses.items()))
+    })
+    return resumo
+
+
+class AnoArquivado:
+    """Leitura sob demanda de um ano arquivado, com as colunas mapeadas em memória"""
+
+    def __init__(self, pasta, quantidade=None, ordenado=False):
+        self.pasta = pasta
+        self.ordenado = ordenado  # Linhas gravadas em ordem de data (ver gravar_ano)
+        self.arquivos = []
+        self.mapas = []
+
+        with open(os.path.join(pasta, 'categorias.json'), encoding='utf-8') as file:
+            self.nomes_categorias = json.load(file)
+
+        self.datas = self.mapear('datas.bin', 'q')
+        self.valores = self.mapear('valores.bin', 'd')
+        self.categorias = self.mapear('categorias.bin', 'i')
+        self.memos_pos = self.mapear('memos_pos.bin', 'q')
+        self.memos = self.mapear('memos.bin', None)
+
+        # O resumo da base é a referência: linhas além dele são de uma gravação interrompida
+        self.quantidade = len(self.valores) if quantidade is None else min(quantidade, len(self.valores))
+
+    def mapear(self, nome, formato):
+        file = open(os.path.join(self.pasta, nome), 'rb')
+        self.arquivos.append(file)
+        if os.fstat(file.fileno()).st_size == 0:
+            return memoryview(b'').cast(formato) if formato else memoryview(b'')
+
+        mapa = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.mapas.append(mapa)
+        visao = memoryview(mapa)
+        return visao.cast(formato) if formato else visao
+
+    def __len__(self):
+        return self.quantidade
+
+    def __getitem__(self, pos):
+        if not 0 <= pos < self.quantidade:
+            raise IndexError(pos)
+
+        valor = self.valores[pos]
+        memo = bytes(self.memos[self.memos_pos[pos]:self.memos_pos[pos + 1]]).decode('utf-8')
+        return {
+            'date': decodificar_data(self.datas[pos]),
+            'amount': valor,
+            'type': 'CREDIT' if valor > 0 else 'DEBIT',
+            'memo': memo,
+            'category': self.nomes_categorias[self.categorias[pos]]
+        }
+
+    def __iter__(self):
+        for pos in range(self.quantidade):
+            yield self[pos]
+
+    def intervalo(self, de=None, ate=None):
+        """Posições (início, fim) das linhas com data em [de, ate], por busca binária
+
+        Em anos gravados fora de ordem (versões anteriores), retorna todas as linhas.
+        """
+        if not self.ordenado:
+            return 0, self.quantidade
+        inicio, fim = 0, self.quantidade
+        if de:
+            inicio = bisect.bisect_left(self.datas, codificar_data(de), 0, fim)
+        if ate:
+            fim = bisect.bisect_left(self.datas, codificar_data(ate + timedelta(days=1)), inicio, fim)
+        return inicio, fim
+
+    def fechar(self):
+        # As visões precisam ser liberadas antes de fechar os mapas
+        for visao in (self.datas, self.valores, self.categorias, self.memos_pos, self.memos):
+            visao.release()
+        for mapa in self.mapas:
+            mapa.close()
+        for file in self.arquivos:
+            file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.fechar()
+
+
+def gravar_ano(pasta, transacoes):
+    """Grava as colunas de um ano em ordem de data, substituindo a pasta existente só ao final"""
+    transacoes = sorted(transacoes, key=lambda trans: codificar_data(trans['date']))
+    temporaria = f"{pasta}.tmp"
+    shutil.rmtree(temporaria, ignore_errors=True)
+    os.makedirs(temporaria)
+
+    nomes_categorias = []
+    codigos = {}
+    datas, valores, categorias = array('q'), array('d'), array('i')
+    memos_pos = array('q', [0])
+    memos = bytearray()
+
+    for trans in transacoes:
+        datas.append(codificar_data(trans['date']))
+        valores.append(trans['amount'])
+
+        categoria = trans['category']
+        if categoria not in codigos:
+            codigos[categoria] = len(nomes_categorias)
+            nomes_categorias.append(categoria)
+        categorias.append(codigos[categoria])
+
+        memos.extend((trans['memo'] or '').encode('utf-8'))
+        memos_pos.append(len(memos))
+
+    for nome, coluna in (('datas.bin', datas), ('valores.bin', valores),
+                         ('categorias.bin', categorias), ('memos_pos.bin', memos_pos)):
+        with open(os.path.join(temporaria, nome), 'wb') as file:
+            coluna.tofile(file)
+    with open(os.path.join(temporaria, 'memos.bin'), 'wb') as file:
+        file.write(memos)
+    with open(os.path.join(temporaria, 'categorias.json'), 'w', encoding='utf-8') as file:
+        json.dump(nomes_categorias, file, ensure_ascii=False)
+
+    antiga = f"{pasta}.old"
+    shutil.rmtree(antiga, ignore_errors=True)
+    if os.path.exists(pasta):
+        os.replace(pasta, antiga)
+    os.replace(temporaria, pasta)
+    shutil.rmtree(antiga, ignore_errors=True)
+
+
+def abrir_ano(pasta_raiz, cliente_id, conta_id, conta, ano):
+    """Abre um ano arquivado da conta para leitura"""
+    resumo = conta['arquivados'][ano]
+    return AnoArquivado(pasta_ano(pasta_raiz, cliente_id, conta_id, ano), resumo['transacoes'],
+                        resumo.get('ordenado', False))
+
+
+def dia(data):
+    return data.date() if isinstance(data, datetime) else data
+
+
+def linhas_ano(pasta_raiz, cliente_id, conta_id, conta, ano, coluna, de=None, ate=None, decrescente=False):
+    """Gera (chave, conta_id, ano, posição, transação) das linhas de um ano arquivado
+
+    O ano só é aberto quando a primeira linha é pedida e é fechado ao final.
+    Em anos gravados em ordem de data, só as linhas de [de, ate] são lidas e
+    saem em ordem de data (inversa com `decrescente`).
+    """
+    with abrir_ano(pasta_raiz, cliente_id, conta_id, conta, ano) as linhas:
+        inicio, fim = linhas.intervalo(de, ate)
+        posicoes = range(fim - 1, inicio - 1, -1) if decrescente else range(inicio, fim)
+        for pos in posicoes:
+            trans = linhas[pos]
+            yield dados.chave_ordenacao(coluna, conta, trans), conta_id, ano, pos, trans
+
+
+def entradas_arquivadas(pasta_raiz, cliente_id, cliente, coluna='date', conta_id=None, de=None, ate=None,
+                        decrescente=False):
+    """Percorre as transações arquivadas do cliente, ordenadas pela coluna informada
+
+    Gera (chave, conta_id, ano, posição, transação), com a mesma chave dos
+    índices de ordenação (dados.chave_ordenacao), para ser combinada com eles
+    por heapq.merge. Só são lidos os anos da conta informada (ou de todas)
+    cujo período cruza [de, ate]; as linhas fora do intervalo não são
+    necessariamente filtradas.
+
+    Em ordem de data, os anos de cada conta são lidos um depois do outro, à
+    medida que as linhas são consumidas. Nas demais colunas, as linhas dos
+    anos selecionados de cada conta precisam ser lidas e ordenadas.
+    """
+    def ordenar(entradas):
+        return sorted(entradas, key=itemgetter(0), reverse=decrescente)
+
+    def entradas_conta(id_conta, conta):
+        anos = [
+            (ano, resumo) for ano, resumo in sorted(list(conta.get('arquivados', {}).items()))
+            if not ((de and dia(resumo['fim']) < de) or (ate and dia(resumo['inicio']) > ate))
+        ]
+        if decrescente:
+            anos.reverse()
+
+        def linhas(ano):
+            return linhas_ano(pasta_raiz, cliente_id, id_conta, conta, ano, coluna, de, ate, decrescente)
+
+        if coluna == 'date':
+            # Os anos não se sobrepõem: basta encadeá-los (os gravados fora de ordem são ordenados)
+            return chain.from_iterable(
+                linhas(ano) if resumo.get('ordenado') else ordenar(linhas(ano)) for ano, resumo in anos
+            )
+        return ordenar(entrada for ano, _ in anos for entrada in linhas(ano))
+
+    por_conta = [
+        entradas_conta(id_conta, conta) for id_conta, conta in list(cliente.get('contas', {}).items())
+        if conta_id is None or id_conta == conta_id
+    ]
+    return heapq.merge(*por_conta, key=itemgetter(0), reverse=decrescente)
+
+
+def arquivar_conta(pasta_raiz, cliente_id, cliente, conta_id, ano_limite):
+    """Move para o arquivo as transações da conta com ano até `ano_limite`
+
+    Anos já arquivados recebem as novas transações ao final. Balanço do
+    cliente não muda (os totais arquivados continuam somados nele); índices
+    e cache de análise da conta são refeitos. Retorna os anos arquivados.
+    """
+    conta = cliente['contas'][conta_id]
+    por_ano = {}
+    restantes = []
+    for trans in conta['transactions']:
+        if trans['date'].year <= ano_limite:
+            por_ano.setdefault(trans['date'].year, []).append(trans)
+        else:
+            restantes.append(trans)
+
+    if not por_ano:
+        return []
+
+    arquivados = conta.setdefault('arquivados', {})
+    for ano, transacoes in sorted(por_ano.items()):
+        if ano in arquivados:
+            with abrir_ano(pasta_raiz, cliente_id, conta_id, conta, ano) as existente:
+                transacoes = list(existente) + transacoes
+
+        gravar_ano(pasta_ano(pasta_raiz, cliente_id, conta_id, ano), transacoes)
+        arquivados[ano] = resumir(transacoes, ano)
+        arquivados[ano]['ordenado'] = True
+
+    # As posições mudam: a conta sai dos índices e volta só com as transações vivas
+    dados.remover_dos_indices(cliente, conta_id)
+    conta['transactions'] = restantes
+    dados.mesclar_indices(cliente, conta_id, 0)
+    conta.pop('analise', None)
+    dados.marcar_alterado(cliente)
+
+    return sorted(por_ano)
@@ -0,0 +1,431 @@
+"""Funções de manipulação dos dados dos clientes, independentes da interface"""
+import heapq
+import re
+from collections import Counter
+from datetime import datetime
+
+# Colunas da visualização de transações que possuem índice de ordenação
+COLUNAS_ORDENACAO = ('date', 'memo', 'amount', 'type', 'category')
+
+# Categorias hierárquicas, ex.: "Despesas:Impostos:ISS"
+SEPARADOR_CATEGORIA = ':'
+
+# Categorias exibidas por nível; as demais são somadas em "Outros"
+TOP_CATEGORIAS = 10
+VALOR_MINIMO = 0.005  # Categorias zeradas (ex.: após desfazer) não são exibidas
+
+
+def balanco_vazio():
+    """Retorna a estrutura de balanço zerada"""
+    return {
+        'receitas': 0,
+        'despesas': 0,
+        'saldo': 0,
+        'categorias': {},
+        'hierarquia': {}  # Total de cada categoria e de cada nível acima dela
+    }
+
+
+def prefixos_categoria(categoria):
+    """'A:B:C' -> ['A', 'A:B', 'A:B:C']"""
+    partes = categoria.split(SEPARADOR_CATEGORIA)
+    return [SEPARADOR_CATEGORIA.join(partes[:i + 1]) for i in range(len(partes))]
+
+
+def obter_hierarquia(balance_data):
+    """Retorna os totais hierárquicos, montando-os a partir das categorias se faltarem"""
+    if 'hierarquia' not in balance_data:
+        hierarquia = {}
+        for categoria, valor in balance_data['categorias'].items():
+            for prefixo in prefixos_categoria(categoria):
+                hierarquia[prefixo] = hierarquia.get(prefixo, 0) + valor
+        balance_data['hierarquia'] = hierarquia
+    return balance_data['hierarquia']
+
+
+def somar_categorias(balance_data, somas):
+    """Soma valores por categoria ao balanço, mantendo os totais dos níveis superiores"""
+    categorias = balance_data['categorias']
+    hierarquia = obter_hierarquia(balance_data)
+    for categoria, valor in somas.items():
+        categorias[categoria] = categorias.get(categoria, 0) + valor
+        for prefixo in prefixos_categoria(categoria):
+            hierarquia[prefixo] = hierarquia.get(prefixo, 0) + valor
+
+
+def somar_ao_balanco(balance_data, transacoes, sinal=1):
+    """Soma (ou subtrai, com sinal=-1) as transações ao balanço já existente"""
+    somas = {}
+    for trans in transacoes:
+        valor = trans['amount'] * sinal
+        if trans['amount'] > 0:
+            balance_data['receitas'] += valor
+        else:
+            balance_data['despesas'] -= valor
+
+        balance_data['saldo'] += valor
+
+        categoria = trans['category']
+        somas[categoria] = somas.get(categoria, 0) + valor
+
+    # Hierarquia atualizada uma vez por categoria, não por transação
+    somar_categorias(balance_data, somas)
+
+
+def somar_arquivados(balance_data, conta, sinal=1):
+    """Soma ao balanço os totais dos exercícios arquivados da conta (ver arquivo.py)"""
+    for resumo in conta.get('arquivados', {}).values():
+        balance_data['receitas'] += resumo['receitas'] * sinal
+        balance_data['despesas'] += resumo['despesas'] * sinal
+        balance_data['saldo'] += resumo['saldo'] * sinal
+        somar_categorias(balance_data, {
+            categoria: valor * sinal for categoria, valor in resumo['categorias'].items()
+        })
+
+
+def ranking_categorias(totais, n=TOP_CATEGORIAS, visiveis=None):
+    """Seleciona as n categorias de maior valor absoluto e agrupa as demais em "Outros"
+
+    Usa seleção por heap (heapq.nlargest) em vez de ordenar todas as
+    categorias. Retorna (itens, outros), com itens em ordem decrescente de
+    valor absoluto e outros igual a None ou {'valor': ..., 'quantidade': ...}.
+    Sem `visiveis`, as categorias zeradas são omitidas; com ele, entram
+    exatamente as categorias do conjunto, mesmo que zeradas.
+    """
+    if visiveis is None:
+        validos = [(nome, valor) for nome, valor in totais.items() if abs(valor) >= VALOR_MINIMO]
+    else:
+        validos = [(nome, valor) for nome, valor in totais.items() if nome in visiveis]
+    itens = heapq.nlargest(n, validos, key=lambda item: abs(item[1]))
+    if len(validos) <= n:
+        return itens, None
+
+    restante = sum(valor for _, valor in validos) - sum(valor for _, valor in itens)
+    return itens, {'valor': restante, 'quantidade': len(validos) - len(itens)}
+
+
+def ranking_hierarquico(balance_data, n=TOP_CATEGORIAS):
+    """Ranking das categorias em cada nível da hierarquia
+
+    Retorna {'itens': [...], 'outros': ...}; cada item tem 'nome' (caminho
+    completo), 'rotulo' (último nível), 'valor' e, da mesma forma, os
+    próprios 'itens' e 'outros' dos níveis abaixo.
+
+    Um nível só é omitido quando nenhuma categoria abaixo dele tem valor: um
+    pai cujas subcategorias se anulam (ex.: Transferencias:Entrada e
+    Transferencias:Saida) continua aparecendo, com total zero.
+    """
+    visiveis = {
+        prefixo
+        for categoria, valor in balance_data['categorias'].items() if abs(valor) >= VALOR_MINIMO
+        for prefixo in prefixos_categoria(categoria)
+    }
+    filhos = {}
+    for nome, valor in obter_hierarquia(balance_data).items():
+        pai = nome.rpartition(SEPARADOR_CATEGORIA)[0]
+        filhos.setdefault(pai, {})[nome] = valor
+
+    def ramo(pai):
+        itens, outros = ranking_categorias(filhos.get(pai, {}), n, visiveis)
+        return {
+            'itens': [
+                dict(nome=nome, rotulo=nome.rpartition(SEPARADOR_CATEGORIA)[2], valor=valor, **ramo(nome))
+                for nome, valor in itens
+            ],
+            'outros': outros
+        }
+
+    return ramo('')
+
+
+def percorrer_ranking(ranking, nivel=0):
+    """Percorre o ranking hierárquico em profundidade, gerando (nível, rótulo, valor, nome)
+
+    O grupo "Outros" de cada nível vem depois dos itens daquele nível, com nome None.
+    """
+    for item in ranking['itens']:
+        yield nivel, item['rotulo'], item['valor'], item['nome']
+        yield from percorrer_ranking(item, nivel + 1)
+    if ranking['outros']:
+        outros = ranking['outros']
+        yield nivel, f"Outros ({outros['quantidade']})", outros['valor'], None
+
+
+def marcar_alterado(cliente):
+    """Incrementa a versão do cliente, invalidando os agregados do painel (ver painel.py)"""
+    cliente['versao'] = cliente.get('versao', 0) + 1
+
+
+def calcular_balanco(cliente):
+    """Recalcula do zero o balanço consolidado de todas as contas do cliente"""
+    balance_data = balanco_vazio()
+    for conta in cliente.get('contas', {}).values():
+        somar_arquivados(balance_data, conta)
+        somar_ao_balanco(balance_data, conta['transactions'])
+
+    cliente['balance_data'] = balance_data
+    return balance_data
+
+
+def converter_transacoes(conta_ofx):
+    """Converte as transações de uma conta de um arquivo OFX já lido para a estrutura interna"""
+    transacoes = []
+    for t in conta_ofx.statement.transactions:
+        transacoes.append({
+            'date': t.date,
+            'amount': float(t.amount),
+            'type': 'CREDIT' if float(t.amount) > 0 else 'DEBIT',
+            'memo': t.memo,
+            'category': 'Não categorizado',
+            'fitid': t.id or None
+        })
+    return transacoes
+
+
+def identificador_transacao(trans):
+    """FITID da transação ou, quando o banco não o informa, data, valor e descrição"""
+    return trans.get('fitid') or (trans['date'], trans['amount'], trans['memo'])
+
+
+def obter_identificadores(conta):
+    """Contagem dos identificadores das transações já importadas na conta
+
+    Fica em conta['identificadores'] e não é afetada pelo arquivamento, para
+    que exercícios arquivados também não sejam importados de novo.
+    """
+    if 'identificadores' not in conta:
+        conta['identificadores'] = Counter(identificador_transacao(t) for t in conta['transactions'])
+    return conta['identificadores']
+
+
+def transacoes_novas(conta, transacoes):
+    """Filtra as transações que ainda não foram importadas na conta
+
+    Transações sem FITID repetidas no mesmo arquivo são mantidas até a
+    quantidade de vezes que aparecem, descontadas as já importadas.
+    """
+    existentes = obter_identificadores(conta)
+    vistas = Counter()
+    novas = []
+    for trans in transacoes:
+        chave = identificador_transacao(trans)
+        vistas[chave] += 1
+        if vistas[chave] > existentes[chave]:
+            novas.append(trans)
+    return novas
+
+
+def aplicar_transacoes(cliente, conta_id, transacoes):
+    """Adiciona transações a uma conta atualizando período, balanço e índices
+
+    O balanço e os índices são atualizados apenas com as novas transações.
+    Retorna a posição da primeira transação adicionada.
+    """
+    conta = cliente['contas'][conta_id]
+    inicio = len(conta['transactions'])
+    if not transacoes:
+        return inicio
+
+    obter_identificadores(conta).update(identificador_transacao(t) for t in transacoes)
+    conta['transactions'].extend(transacoes)
+
+    # Atualiza período
+    datas = [t['date'] for t in transacoes]
+    if not conta['periodos']['inicio']:
+        conta['periodos']['inicio'] = min(datas)
+    if not conta['periodos']['fim'] or max(datas) > conta['periodos']['fim']:
+        conta['periodos']['fim'] = max(datas)
+
+    somar_ao_balanco(cliente['balance_data'], transacoes)
+    mesclar_indices(cliente, conta_id, inicio)
+    conta['ultima_importacao'] = datetime.now()
+
+    # Descarta as análises em cache da conta (ver analise.py)
+    conta.pop('analise', None)
+    marcar_alterado(cliente)
+    return inicio
+
+
+def remover_transacoes(cliente, conta_id, inicio):
+    """Remove as transações da conta a partir de `inicio`, desfazendo seus efeitos
+
+    Balanço e índices são ajustados apenas com as transações removidas, que
+    são retornadas. O período da conta deve ser restaurado por quem chama.
+    """
+    conta = cliente['contas'][conta_id]
+    removidas = conta['transactions'][inicio:]
+    del conta['transactions'][inicio:]
+    if 'identificadores' in conta:
+        conta['identificadores'] -= Counter(identificador_transacao(t) for t in removidas)
+
+    somar_ao_balanco(cliente['balance_data'], removidas, sinal=-1)
+    remover_dos_indices(cliente, conta_id, inicio)
+    conta.pop('analise', None)
+    marcar_alterado(cliente)
+    return removidas
+
+
+def remover_conta(cliente, conta_id):
+    """Remove a conta do cliente, descontando-a do balanço e dos índices
+
+    Retorna a própria conta removida, sem cópia.
+    """
+    conta = cliente['contas'].pop(conta_id)
+    somar_arquivados(cliente['balance_data'], conta, sinal=-1)
+    somar_ao_balanco(cliente['balance_data'], conta['transactions'], sinal=-1)
+    remover_dos_indices(cliente, conta_id)
+    marcar_alterado(cliente)
+    return conta
+
+
+def restaurar_conta(cliente, conta_id, conta):
+    """Devolve ao cliente uma conta removida com remover_conta"""
+    if conta_id in cliente['contas']:
+        raise ValueError(f"O ID {conta_id} já está em uso por outra conta")
+    cliente['contas'][conta_id] = conta
+    somar_arquivados(cliente['balance_data'], conta)
+    somar_ao_balanco(cliente['balance_data'], conta['transactions'])
+    mesclar_indices(cliente, conta_id, 0)
+    marcar_alterado(cliente)
+
+
+def alterar_categorias(cliente, alteracoes):
+    """Altera a categoria de transações, ajustando balanço e índice de categorias
+
+    `alteracoes` é uma lista de (conta_id, posição, categoria nova). Como em
+    mesclar_indices, o índice de categorias é substituído por uma nova lista
+    (quem já o percorre continua com a fotografia anterior), montada uma única
+    vez para todas as transações. Retorna as categorias anteriores, na mesma ordem.
+    """
+    anteriores = []
+    alteradas = set()
+    for conta_id, pos, categoria in alteracoes:
+        trans = cliente['contas'][conta_id]['transactions'][pos]
+        anterior = trans['category']
+        anteriores.append(anterior)
+        if anterior == categoria:
+            continue
+
+        somar_categorias(cliente['balance_data'], {anterior: -trans['amount']})
+        somar_categorias(cliente['balance_data'], {categoria: trans['amount']})
+        trans['category'] = categoria
+        alteradas.add((conta_id, pos))
+
+    if not alteradas:
+        return anteriores
+
+    if 'indices' in cliente:
+        novas = sorted(
+            (chave_ordenacao('category', cliente['contas'][conta_id],
+                             cliente['contas'][conta_id]['transactions'][pos]), conta_id, pos)
+            for conta_id, pos in alteradas
+        )
+        mantidas = (entrada for entrada in cliente['indices']['category'] if entrada[1:] not in alteradas)
+        cliente['indices']['category'] = list(heapq.merge(mantidas, novas))
+
+    marcar_alterado(cliente)
+    return anteriores
+
+
+def proximo_id(itens, reservados=()):
+    """Próximo ID numérico livre de um dicionário de clientes ou contas
+
+    Usa o maior ID existente, e não a quantidade de itens, para não reutilizar
+    o ID de um item removido; `reservados` são os IDs removidos que ainda podem
+    ser restaurados pelo desfazer (ver Historico.ids_removidos).
+    """
+    ids = [int(item_id) for item_id in (*itens, *reservados) if str(item_id).isdigit()]
+    return str(max(ids, default=0) + 1)
+
+
+def normalizar_numero_conta(numero):
+    """Mantém apenas os dígitos do número da conta, para comparação"""
+    return re.sub(r'\D', '', str(numero or ''))
+
+
+def mapa_contas(clientes):
+    """Mapeia número normalizado da conta -> (cliente_id, conta_id)"""
+    mapa = {}
+    for cliente_id, cliente in clientes.items():
+        for conta_id, conta in cliente.get('contas', {}).items():
+            numero = normalizar_numero_conta(conta['numero'])
+            if numero:
+                mapa[numero] = (cliente_id, conta_id)
+    return mapa
+
+
+def chave_ordenacao(coluna, conta, trans):
+    """Retorna a chave usada para ordenar uma transação pela coluna informada"""
+    if coluna == 'memo':
+        # Mesma descrição exibida na visualização: "Banco - Memo"
+        return f"{conta['banco']} - {trans['memo'] or ''}".lower()
+    if coluna in ('type', 'category'):
+        return (trans[coluna] or '').lower()
+    if coluna == 'amount':
+        # A coluna Valor exibe o valor absoluto (o sinal está no tipo)
+        return abs(trans['amount'])
+    return trans[coluna]
+
+
+def entradas_indice(coluna, conta_id, conta, inicio=0):
+    """Gera as entradas ordenadas (chave, conta_id, posição) das transações a partir de `inicio`"""
+    transacoes = conta['transactions']
+    return sorted(
+        (chave_ordenacao(coluna, conta, transacoes[pos]), conta_id, pos)
+        for pos in range(inicio, len(transacoes))
+    )
+
+
+def construir_indice(cliente, coluna):
+    """Constrói o índice de uma coluna, sem guardá-lo no cliente"""
+    entradas = []
+    for conta_id, conta in list(cliente.get('contas', {}).items()):
+        entradas.extend(entradas_indice(coluna, conta_id, conta))
+    entradas.sort()
+    return entradas
+
+
+def construir_indices(cliente):
+    """Constrói do zero os índices de ordenação de todas as contas do cliente"""
+    indices = {coluna: construir_indice(cliente, coluna) for coluna in COLUNAS_ORDENACAO}
+    cliente['indices'] = indices
+    return indices
+
+
+def obter_indices(cliente):
+    """Retorna os índices do cliente, construindo-os se ainda não existirem"""
+    if 'indices' not in cliente:
+        return construir_indices(cliente)
+    return cliente['indices']
+
+
+def mesclar_indices(cliente, conta_id, inicio):
+    """Mescla nos índices as transações da conta adicionadas a partir de `inicio`
+
+    Apenas as novas transações são ordenadas; o restante já está em ordem e
+    é combinado em uma única passada com heapq.merge.
+    """
+    if 'indices' not in cliente:
+        construir_indices(cliente)
+        return
+
+    conta = cliente['contas'][conta_id]
+    indices = cliente['indices']
+    for coluna in COLUNAS_ORDENACAO:
+        novas = entradas_indice(coluna, conta_id, conta, inicio)
+        if novas:
+            indices[coluna] = list(heapq.merge(indices[coluna], novas))
+
+
+def remover_dos_indices(cliente, conta_id, inicio=0):
+    """Remove dos índices as transações da conta a partir da posição `inicio`"""
+    if 'indices' not in cliente:
+        return
+
+    indices = cliente['indices']
+    for coluna in COLUNAS_ORDENACAO:
+        # Filtrar preserva a ordem, não é preciso reordenar
+        indices[coluna] = [
+            entrada for entrada in indices[coluna]
+            if entrada[1] != conta_id or entrada[2] < inicio
+        ]
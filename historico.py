@@ -0,0 +1,148 @@
+"""Desfazer/refazer de importações, remoções e edições de categoria
+
+Cada operação guarda apenas o delta da alteração: as transações importadas,
+a referência para a conta ou cliente removido (sem cópia) ou as categorias
+anteriores. Desfazer e refazer ajustam os dados derivados (balanço, índices,
+período e análises em cache) pelas funções de dados.py.
+"""
+import dados
+
+
+class Importacao:
+    """Transações adicionadas ao final de uma conta"""
+
+    def __init__(self, cliente_id, conta_id, inicio, periodos_anteriores, ultima_importacao_anterior=None):
+        self.cliente_id = cliente_id
+        self.conta_id = conta_id
+        self.inicio = inicio
+        self.periodos_anteriores = periodos_anteriores
+        self.periodos_posteriores = None
+        self.ultima_importacao_anterior = ultima_importacao_anterior
+        self.ultima_importacao_posterior = None
+        self.transacoes = None  # Preenchido ao desfazer, para permitir refazer
+
+    def descricao(self):
+        return "importação"
+
+    def desfazer(self, clientes):
+        cliente = clientes[self.cliente_id]
+        conta = cliente['contas'][self.conta_id]
+        self.periodos_posteriores = dict(conta['periodos'])
+        self.ultima_importacao_posterior = conta.get('ultima_importacao')
+        self.transacoes = dados.remover_transacoes(cliente, self.conta_id, self.inicio)
+        conta['periodos'] = dict(self.periodos_anteriores)
+        conta['ultima_importacao'] = self.ultima_importacao_anterior
+
+    def refazer(self, clientes):
+        cliente = clientes[self.cliente_id]
+        dados.aplicar_transacoes(cliente, self.conta_id, self.transacoes)
+        cliente['contas'][self.conta_id]['periodos'] = dict(self.periodos_posteriores)
+        cliente['contas'][self.conta_id]['ultima_importacao'] = self.ultima_importacao_posterior
+        self.transacoes = None
+
+
+class RemocaoConta:
+    """Conta removida de um cliente"""
+
+    def __init__(self, cliente_id, conta_id, conta):
+        self.cliente_id = cliente_id
+        self.conta_id = conta_id
+        self.conta = conta
+
+    def descricao(self):
+        return f"remoção da conta {self.conta['banco']} - {self.conta['numero']}"
+
+    def desfazer(self, clientes):
+        dados.restaurar_conta(clientes[self.cliente_id], self.conta_id, self.conta)
+
+    def refazer(self, clientes):
+        dados.remover_conta(clientes[self.cliente_id], self.conta_id)
+
+
+class RemocaoCliente:
+    """Cliente removido do sistema"""
+
+    def __init__(self, cliente_id, cliente):
+        self.cliente_id = cliente_id
+        self.cliente = cliente
+
+    def descricao(self):
+        return f"remoção do cliente {self.cliente['nome']}"
+
+    def desfazer(self, clientes):
+        if self.cliente_id in clientes:
+            raise ValueError(f"O ID {self.cliente_id} já está em uso por outro cliente")
+        clientes[self.cliente_id] = self.cliente
+
+    def refazer(self, clientes):
+        del clientes[self.cliente_id]
+
+
+class EdicaoCategoria:
+    """Categoria alterada em uma ou mais transações de um cliente"""
+
+    def __init__(self, cliente_id, categoria, anteriores):
+        self.cliente_id = cliente_id
+        self.categoria = categoria
+        self.anteriores = anteriores  # Lista de (conta_id, posição, categoria anterior)
+
+    def descricao(self):
+        return f"edição de categoria ({len(self.anteriores)} transações)"
+
+    def desfazer(self, clientes):
+        dados.alterar_categorias(clientes[self.cliente_id], list(reversed(self.anteriores)))
+
+    def refazer(self, clientes):
+        dados.alterar_categorias(
+            clientes[self.cliente_id], [(conta_id, pos, self.categoria) for conta_id, pos, _ in self.anteriores])
+
+
+class Historico:
+    """Pilhas de operações para desfazer e refazer"""
+
+    def __init__(self, limite=100):
+        self.limite = limite
+        self.desfazer_pilha = []
+        self.refazer_pilha = []
+
+    def registrar(self, operacao):
+        """Registra uma operação já executada; descarta o que havia para refazer"""
+        self.desfazer_pilha.append(operacao)
+        if len(self.desfazer_pilha) > self.limite:
+            del self.desfazer_pilha[0]
+        self.refazer_pilha.clear()
+
+    def desfazer(self, clientes):
+        """Desfaz a última operação e retorna sua descrição (ou None)"""
+        if not self.desfazer_pilha:
+            return None
+
+        # A operação só sai da pilha se for desfeita sem erro
+        operacao = self.desfazer_pilha[-1]
+        operacao.desfazer(clientes)
+        self.refazer_pilha.append(self.desfazer_pilha.pop())
+        return operacao.descricao()
+
+    def refazer(self, clientes):
+        """Refaz a última operação desfeita e retorna sua descrição (ou None)"""
+        if not self.refazer_pilha:
+            return None
+
+        operacao = self.refazer_pilha[-1]
+        operacao.refazer(clientes)
+        self.desfazer_pilha.append(self.refazer_pilha.pop())
+        return operacao.descricao()
+
+    def ids_removidos(self, cliente_id=None):
+        """IDs de clientes (ou das contas de `cliente_id`) removidos que ainda podem ser restaurados"""
+        ids = set()
+        for operacao in (*self.desfazer_pilha, *self.refazer_pilha):
+            if cliente_id is None and isinstance(operacao, RemocaoCliente):
+                ids.add(operacao.cliente_id)
+            elif isinstance(operacao, RemocaoConta) and operacao.cliente_id == cliente_id:
+                ids.add(operacao.conta_id)
+        return ids
+
+    def limpar(self):
+        self.desfazer_pilha.clear()
+        self.refazer_pilha.clear()
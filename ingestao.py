@@ -0,0 +1,216 @@
+"""Serviço de ingestão contínua de arquivos OFX a partir de uma pasta monitorada
+
+Uso:
+    python ingestao.py PASTA --base base.pkl [--workers N] [--intervalo SEG] [--uma-vez]
+
+Cada arquivo é associado ao cliente e à conta pelo número da conta informado
+no OFX. Transações já importadas na conta (pelo FITID, ver
+dados.transacoes_novas) são ignoradas, inclusive quando um arquivo é
+regravado com conteúdo novo. O checkpoint (arquivos já aplicados) é salvo
+junto com os clientes na mesma base, de forma atômica, para que o serviço
+retome corretamente após uma reinicialização.
+"""
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import ofxparse
+
+import armazenamento
+import dados
+
+logger = logging.getLogger('ingestao')
+
+
+def ler_ofx(caminho):
+    """Lê um arquivo OFX e retorna as transações de cada conta
+
+    Executada nos processos do pool; retorna apenas tipos simples para que o
+    resultado possa ser enviado de volta ao processo principal.
+    """
+    try:
+        with open(caminho, 'rb') as file:
+            ofx = ofxparse.OfxParser.parse(file)
+
+        contas = [(conta.account_id, dados.converter_transacoes(conta)) for conta in ofx.accounts]
+        return {'contas': contas, 'erro': None}
+
+    except Exception as e:
+        return {'contas': [], 'erro': str(e)}
+
+
+class ServicoIngestao:
+    """Monitora uma pasta e importa os arquivos OFX novos ou alterados"""
+
+    def __init__(self, pasta, caminho_base, workers=None, intervalo=5, estabilidade=2, lote=100):
+        self.pasta = pasta
+        self.caminho_base = caminho_base
+        self.workers = workers
+        self.intervalo = intervalo
+        self.estabilidade = estabilidade  # segundos sem alteração antes de ler o arquivo
+        self.lote = lote  # arquivos processados entre dois salvamentos da base
+
+        self.clientes = {}
+        self.checkpoint = {}
+        self.sem_conta = {}  # arquivo -> assinatura, aguardando cadastro da conta
+        self.mtime_base = None
+        self.carregar()
+
+    def carregar(self):
+        """Carrega clientes e checkpoint da base"""
+        self.mtime_base = armazenamento.mtime_base(self.caminho_base)
+        self.clientes, self.checkpoint = armazenamento.carregar_base(self.caminho_base)
+        self.sem_conta = {}
+
+    def recarregar_se_alterada(self):
+        """Recarrega a base se ela foi salva por outro processo (ex.: a interface)"""
+        if armazenamento.mtime_base(self.caminho_base) != self.mtime_base:
+            logger.info("Base alterada externamente, recarregando")
+            self.carregar()
+
+    def salvar(self):
+        """Salva a base; retorna False se ela foi gravada por outro processo desde o carregamento"""
+        try:
+            self.mtime_base = armazenamento.salvar_base(
+                self.caminho_base, self.clientes, self.checkpoint, mtime_esperado=self.mtime_base)
+        except armazenamento.ErroBaseAlterada:
+            return False
+        return True
+
+    def arquivos_pendentes(self):
+        """Lista (nome, assinatura) dos arquivos novos ou alterados, do mais antigo ao mais novo"""
+        agora = time.time()
+        pendentes = []
+
+        with os.scandir(self.pasta) as entradas:
+            for entrada in entradas:
+                if not entrada.is_file() or not entrada.name.lower().endswith('.ofx'):
+                    continue
+
+                info = entrada.stat()
+                if agora - info.st_mtime < self.estabilidade:
+                    continue  # Provavelmente ainda está sendo gravado
+
+                assinatura = [info.st_size, info.st_mtime_ns]
+                registro = self.checkpoint.get(entrada.name)
+                if registro and registro['assinatura'] == assinatura:
+                    continue
+                if self.sem_conta.get(entrada.name) == assinatura:
+                    continue
+
+                pendentes.append((info.st_mtime_ns, entrada.name, assinatura))
+
+        pendentes.sort()
+        return [(nome, assinatura) for _, nome, assinatura in pendentes]
+
+    def aplicar_arquivo(self, nome, assinatura, resultado, mapa):
+        """Aplica as transações lidas de um arquivo e atualiza o checkpoint
+
+        Retorna a quantidade de transações importadas.
+        """
+        if resultado['erro']:
+            logger.error(f"Falha ao ler {nome}: {resultado['erro']}")
+            self.checkpoint[nome] = {'assinatura': assinatura, 'erro': resultado['erro']}
+            self.sem_conta.pop(nome, None)
+            return 0
+
+        # O arquivo só é aplicado quando todas as suas contas estão cadastradas
+        destinos = []
+        for numero, transacoes in resultado['contas']:
+            destino = mapa.get(dados.normalizar_numero_conta(numero))
+            if destino is None:
+                logger.warning(f"Conta {numero} do arquivo {nome} não cadastrada, aguardando")
+                self.sem_conta[nome] = assinatura
+                return 0
+            destinos.append((destino, transacoes))
+
+        importadas = 0
+        repetidas = 0
+        for (cliente_id, conta_id), transacoes in destinos:
+            cliente = self.clientes[cliente_id]
+            novas = dados.transacoes_novas(cliente['contas'][conta_id], transacoes)
+            dados.aplicar_transacoes(cliente, conta_id, novas)
+            importadas += len(novas)
+            repetidas += len(transacoes) - len(novas)
+
+        if repetidas:
+            logger.info(f"{nome}: {repetidas} transações já importadas foram ignoradas")
+
+        self.checkpoint[nome] = {
+            'assinatura': assinatura,
+            'importadas': importadas,
+            'importado_em': datetime.now()
+        }
+        self.sem_conta.pop(nome, None)
+        return importadas
+
+    def processar_pendentes(self, executor):
+        """Lê os arquivos pendentes no pool e aplica os resultados em ordem"""
+        pendentes = self.arquivos_pendentes()
+        total = 0
+
+        for i in range(0, len(pendentes), self.lote):
+            lote = pendentes[i:i + self.lote]
+            caminhos = [os.path.join(self.pasta, nome) for nome, _ in lote]
+            # executor.map preserva a ordem, mantendo a aplicação determinística
+            resultados = list(executor.map(ler_ofx, caminhos))
+
+            while True:
+                mapa = dados.mapa_contas(self.clientes)
+                importadas = 0
+                alterado = False
+                for (nome, assinatura), resultado in zip(lote, resultados):
+                    importadas += self.aplicar_arquivo(nome, assinatura, resultado, mapa)
+                    # Arquivos aguardando cadastro da conta não alteram o checkpoint
+                    if nome not in self.sem_conta:
+                        alterado = True
+
+                if not alterado or self.salvar():
+                    break
+
+                # Outro processo salvou a base durante o lote: recarrega e reaplica
+                # sobre a versão dele (as transações repetidas são ignoradas pelo FITID)
+                logger.info("Base alterada externamente durante o lote, reaplicando")
+                self.carregar()
+
+            total += importadas
+
+        return total
+
+    def executar(self, uma_vez=False):
+        """Executa o laço de monitoramento da pasta"""
+        logger.info(f"Monitorando {self.pasta} (base: {self.caminho_base})")
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                self.recarregar_se_alterada()
+                importadas = self.processar_pendentes(executor)
+                if importadas:
+                    logger.info(f"Importadas {importadas} transações")
+
+                if uma_vez:
+                    return
+                time.sleep(self.intervalo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestão contínua de arquivos OFX")
+    parser.add_argument('pasta', help="Pasta monitorada")
+    parser.add_argument('--base', required=True, help="Arquivo da base de clientes")
+    parser.add_argument('--workers', type=int, default=None, help="Processos para leitura dos arquivos")
+    parser.add_argument('--intervalo', type=float, default=5, help="Segundos entre verificações da pasta")
+    parser.add_argument('--uma-vez', action='store_true', help="Processa os arquivos pendentes e encerra")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    servico = ServicoIngestao(args.pasta, args.base, workers=args.workers, intervalo=args.intervalo)
+    try:
+        servico.executar(uma_vez=args.uma_vez)
+    except KeyboardInterrupt:
+        logger.info("Encerrando")
+
+
+if __name__ == "__main__":
+    main()
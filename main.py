@@ -1,15 +1,25 @@
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
+from tkinter import ttk, filedialog, messagebox, simpledialog
 import ofxparse
 from xml.etree import ElementTree as ET
 from xml.dom import minidom
-from fpdf import FPDF
 import os
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from tkcalendar import DateEntry
+import dados
+import analise
+import arquivo
+import armazenamento
+import historico
+import painel
+import relatorios
+import servidor
 
 class FinanceApp:
-    def __init__(self, root):
+    def __init__(self, root, caminho_base=None, porta_api=None):
         self.root = root
         self.root.title("Sistema de Balanço Financeiro")
         self.root.geometry("900x600")
@@ -36,6 +46,21 @@ class FinanceApp:
         }
         self.cliente_atual = None
         self.conta_atual = None
+
+        # Base persistida e checkpoint do serviço de ingestão (ingestao.py)
+        self.caminho_base = None
+        self.checkpoint_ingestao = {}
+        self.mtime_base = None  # mtime da base quando carregada ou salva por esta janela
+
+        # Desfazer/refazer de importações, remoções e edições de categoria
+        self.historico = historico.Historico()
+
+        # Atualização do painel em andamento (ver atualizar_painel)
+        self.painel_em_andamento = False
+
+        # Ordenação da visualização de transações (coluna e sentido)
+        self.coluna_ordenacao = None
+        self.ordem_decrescente = False
     
     # Criar notebook (abas)
         self.notebook = ttk.Notebook(root)
@@ -47,10 +72,22 @@ class FinanceApp:
         self.create_import_tab()
         self.create_view_tab()
         self.create_balance_tab()
+        self.create_dashboard_tab()
 
         self.status_conta_label = ttk.Label(self.root, text="Conta selecionada: Nenhuma")
         self.status_conta_label.pack(side='bottom', fill='x')
 
+        self.root.bind_all('<Control-z>', lambda event: self.desfazer())
+        self.root.bind_all('<Control-y>', lambda event: self.refazer())
+
+        if caminho_base:
+            self.carregar_base(caminho_base)
+
+        # API local de consulta (servidor.py), em uma thread própria
+        self.servidor_api = None
+        if porta_api is not None:
+            self.iniciar_api(porta_api)
+
     def create_client_tab(self):
         """Cria a aba de gerenciamento de clientes"""
         client_tab = ttk.Frame(self.notebook)
@@ -99,6 +136,9 @@ class FinanceApp:
         ttk.Button(button_frame, text="Remover Cliente",
                   command=self.remover_cliente).pack(side='left', padx=5)
 
+        ttk.Button(button_frame, text="Relatórios em Lote",
+                  command=self.gerar_relatorios_lote).pack(side='left', padx=5)
+
         # Atualizar lista de clientes
         self.update_client_list()
 
@@ -109,16 +149,11 @@ class FinanceApp:
             messagebox.showwarning("Aviso", "Digite um nome para o cliente")
             return
 
-        cliente_id = str(len(self.clientes) + 1)
+        cliente_id = dados.proximo_id(self.clientes, self.historico.ids_removidos())
         self.clientes[cliente_id] = {
             'nome': nome,
             'contas': {},  # Contas serão adicionadas posteriormente
-            'balance_data': {
-                'receitas': 0,
-                'despesas': 0,
-                'saldo': 0,
-                'categorias': {}
-            }
+            'balance_data': dados.balanco_vazio()
         }
 
         self.nome_cliente_entry.delete(0, 'end')
@@ -157,11 +192,12 @@ class FinanceApp:
             return
 
         item = self.client_tree.item(selected[0])
-        cliente_id = item['values'][0]
+        cliente_id = str(item['values'][0])
         cliente_nome = self.clientes[cliente_id]['nome']
 
         if messagebox.askyesno("Confirmar", f"Remover o cliente {cliente_nome}? Todos os dados serão perdidos."):
-            del self.clientes[cliente_id]
+            cliente = self.clientes.pop(cliente_id)
+            self.historico.registrar(historico.RemocaoCliente(cliente_id, cliente))
 
                 # Se o cliente removido era o atual, limpar seleção
             if self.cliente_atual == cliente_id:
@@ -185,11 +221,12 @@ class FinanceApp:
             self.client_tree.delete(item)
 
         for cliente_id, dados in self.clientes.items():
-            # Calcula o total de transações de todas as contas do cliente
+            # Calcula o total de transações de todas as contas do cliente, inclusive as arquivadas
             total_transacoes = 0
             if 'contas' in dados:
                 for conta in dados['contas'].values():
                     total_transacoes += len(conta['transactions'])
+                    total_transacoes += sum(r['transacoes'] for r in conta.get('arquivados', {}).values())
 
             saldo = dados['balance_data']['saldo']
             saldo_str = f"R$ {saldo:,.2f}"
@@ -242,6 +279,10 @@ class FinanceApp:
         ttk.Button(button_frame, text="Remover Conta",
                   command=self.remover_conta).pack(side='left', padx=5)
 
+        # Botão para mover exercícios encerrados para o arquivo
+        ttk.Button(button_frame, text="Arquivar Exercícios",
+                  command=self.arquivar_exercicios).pack(side='left', padx=5)
+
         self.account_tree.pack(fill='both', expand=True, padx=10, pady=10)
 
     def adicionar_conta(self):
@@ -261,9 +302,9 @@ class FinanceApp:
             messagebox.showwarning("Aviso", "Preencha todos os campos da conta")
             return
 
-        # Gera ID da conta (pode ser sequencial ou usar UUID)
+        # Gera ID da conta, sem reutilizar o de uma conta removida
         contas = self.clientes[self.cliente_atual]['contas']
-        conta_id = str(len(contas) + 1)
+        conta_id = dados.proximo_id(contas, self.historico.ids_removidos(self.cliente_atual))
 
         contas[conta_id] = {
             'banco': banco,
@@ -293,20 +334,70 @@ class FinanceApp:
             return
 
         item = self.account_tree.item(selected[0])
-        conta_id = item['values'][0]
+        conta_id = str(item['values'][0])
 
         conta = self.clientes[self.cliente_atual]['contas'][conta_id]
         if messagebox.askyesno("Confirmar", f"Remover conta {conta['banco']} - {conta['numero']}?"):
-            del self.clientes[self.cliente_atual]['contas'][conta_id]
+            # Desconta a conta do balanço e dos índices sem recalcular o cliente
+            dados.remover_conta(self.clientes[self.cliente_atual], conta_id)
+            self.historico.registrar(historico.RemocaoConta(self.cliente_atual, conta_id, conta))
             
             # Se estava selecionada, deseleciona
             if self.conta_atual == conta_id:
                 self.conta_atual = None
             
             self.update_account_list()
-            self.calcular_balanco()
+            self.update_transaction_view()
+            self.update_balance_view()
+            self.update_client_list()
             messagebox.showinfo("Sucesso", "Conta removida")
 
+    def arquivar_exercicios(self):
+        """Move para o arquivo as transações dos exercícios encerrados do cliente atual"""
+        if not self.cliente_atual:
+            messagebox.showwarning("Aviso", "Selecione um cliente primeiro")
+            return
+
+        if not self.caminho_base:
+            messagebox.showwarning("Aviso", "Salve a base antes de arquivar exercícios")
+            return
+
+        ano_limite = simpledialog.askinteger(
+            "Arquivar Exercícios", "Arquivar transações até o ano:",
+            initialvalue=datetime.now().year - 1, parent=self.root)
+        if not ano_limite:
+            return
+
+        if armazenamento.mtime_base(self.caminho_base) != self.mtime_base:
+            messagebox.showwarning(
+                "Aviso", "A base foi alterada por outro processo. Abra-a novamente antes de arquivar exercícios")
+            return
+
+        cliente = self.clientes[self.cliente_atual]
+        pasta_raiz = self.pasta_arquivo()
+        try:
+            anos = set()
+            for conta_id in list(cliente['contas']):
+                anos.update(arquivo.arquivar_conta(pasta_raiz, self.cliente_atual, cliente, conta_id, ano_limite))
+
+            # As posições das transações mudaram: o histórico não vale mais
+            self.historico.limpar()
+            self.mtime_base = armazenamento.salvar_base(
+                self.caminho_base, self.clientes, self.checkpoint_ingestao, mtime_esperado=self.mtime_base)
+        except Exception as e:
+            messagebox.showerror("Erro", f"Falha ao arquivar exercícios: {str(e)}")
+            return
+
+        self.update_account_list()
+        self.update_transaction_view()
+        self.update_balance_view()
+        self.update_client_list()
+
+        if anos:
+            messagebox.showinfo("Sucesso", f"Exercícios arquivados: {', '.join(str(a) for a in sorted(anos))}")
+        else:
+            messagebox.showinfo("Aviso", f"Nenhuma transação até {ano_limite} para arquivar")
+
     def update_account_list(self):
         """Atualiza a lista de contas com verificação de estrutura"""
         # Limpa a treeview
@@ -417,6 +508,19 @@ class FinanceApp:
         ttk.Button(button_frame, text="Salvar em XML",
                   command=self.save_to_xml).pack(side='left', padx=5)
 
+        # Frame da base de dados
+        base_frame = ttk.LabelFrame(import_tab, text="Base de Dados")
+        base_frame.pack(pady=10, padx=10, fill='x')
+
+        ttk.Button(base_frame, text="Abrir Base",
+                  command=self.abrir_base).pack(side='left', padx=5, pady=5)
+
+        ttk.Button(base_frame, text="Salvar Base",
+                  command=self.salvar_base).pack(side='left', padx=5, pady=5)
+
+        self.base_label = ttk.Label(base_frame, text="Nenhuma base aberta")
+        self.base_label.pack(side='left', padx=5, pady=5)
+
         # Área de status
         self.status_label = ttk.Label(import_tab, text="Pronto para importar")
         self.status_label.pack(pady=10)
@@ -430,12 +534,17 @@ class FinanceApp:
         columns = ('date', 'memo', 'amount', 'type', 'category')
         self.transaction_tree = ttk.Treeview(view_tab, columns=columns, show='headings')
 
-        # Definir cabeçalhos
-        self.transaction_tree.heading('date', text='Data')
-        self.transaction_tree.heading('memo', text='Descrição')
-        self.transaction_tree.heading('amount', text='Valor')
-        self.transaction_tree.heading('type', text='Tipo')
-        self.transaction_tree.heading('category', text='Categoria')
+        # Definir cabeçalhos (clicáveis para ordenar)
+        self.titulos_transacoes = {
+            'date': 'Data',
+            'memo': 'Descrição',
+            'amount': 'Valor',
+            'type': 'Tipo',
+            'category': 'Categoria'
+        }
+        for coluna, titulo in self.titulos_transacoes.items():
+            self.transaction_tree.heading(coluna, text=titulo,
+                                          command=lambda c=coluna: self.ordenar_transacoes(c))
 
         # Definir largura das colunas
         self.transaction_tree.column('date', width=100)
@@ -456,6 +565,15 @@ class FinanceApp:
         ttk.Button(button_frame, text="Abrir Visualização Detalhada",
                   command=self.open_detailed_view).pack(side='left', padx=5)
 
+        ttk.Button(button_frame, text="Editar Categoria",
+                  command=self.editar_categoria).pack(side='left', padx=5)
+
+        ttk.Button(button_frame, text="Desfazer",
+                  command=self.desfazer).pack(side='left', padx=5)
+
+        ttk.Button(button_frame, text="Refazer",
+                  command=self.refazer).pack(side='left', padx=5)
+
     def create_balance_tab(self):
         """Cria a aba de balanço financeiro"""
         balance_tab = ttk.Frame(self.notebook)
@@ -478,18 +596,59 @@ class FinanceApp:
         self.balance_label = ttk.Label(summary_frame, text="R$ 0,00", foreground='blue')
         self.balance_label.grid(row=2, column=1, sticky='w', padx=5, pady=5)
 
+        # Frame de fluxo de caixa (valores mais recentes das séries de cada conta)
+        flow_frame = ttk.LabelFrame(balance_tab, text="Fluxo de Caixa")
+        flow_frame.pack(pady=10, padx=10, fill='x')
+
+        columns = ('conta', 'dia', 'saldo', 'media', 'rec30', 'desp30', 'rec90', 'desp90')
+        self.flow_tree = ttk.Treeview(flow_frame, columns=columns, show='headings', height=4)
+
+        self.flow_tree.heading('conta', text='Conta')
+        self.flow_tree.heading('dia', text='Até')
+        self.flow_tree.heading('saldo', text='Saldo Acumulado')
+        self.flow_tree.heading('media', text='Média Móvel 30d')
+        self.flow_tree.heading('rec30', text='Receitas 30d')
+        self.flow_tree.heading('desp30', text='Despesas 30d')
+        self.flow_tree.heading('rec90', text='Receitas 90d')
+        self.flow_tree.heading('desp90', text='Despesas 90d')
+
+        for column in columns:
+            self.flow_tree.column(column, width=100)
+        self.flow_tree.column('conta', width=150)
+
+        self.flow_tree.pack(fill='x', padx=10, pady=10)
+
+        # Frame de exercícios arquivados (totais pré-calculados, ver arquivo.py)
+        archive_frame = ttk.LabelFrame(balance_tab, text="Exercícios Arquivados")
+        archive_frame.pack(pady=10, padx=10, fill='x')
+
+        columns = ('conta', 'ano', 'transacoes', 'receitas', 'despesas', 'saldo')
+        self.archive_tree = ttk.Treeview(archive_frame, columns=columns, show='headings', height=3)
+
+        self.archive_tree.heading('conta', text='Conta')
+        self.archive_tree.heading('ano', text='Ano')
+        self.archive_tree.heading('transacoes', text='Transações')
+        self.archive_tree.heading('receitas', text='Receitas')
+        self.archive_tree.heading('despesas', text='Despesas')
+        self.archive_tree.heading('saldo', text='Saldo')
+
+        for column in columns:
+            self.archive_tree.column(column, width=100)
+        self.archive_tree.column('conta', width=150)
+
+        self.archive_tree.pack(fill='x', padx=10, pady=10)
+
         # Frame de categorias
         category_frame = ttk.LabelFrame(balance_tab, text="Por Categoria")
         category_frame.pack(pady=10, padx=10, fill='both', expand=True)
 
-        # Treeview para categorias
-        columns = ('category', 'amount')
-        self.category_tree = ttk.Treeview(category_frame, columns=columns, show='headings')
+        # Treeview para categorias (hierárquica: "Despesas:Impostos:ISS")
+        self.category_tree = ttk.Treeview(category_frame, columns=('amount',), show='tree headings')
 
-        self.category_tree.heading('category', text='Categoria')
+        self.category_tree.heading('#0', text='Categoria')
         self.category_tree.heading('amount', text='Valor')
 
-        self.category_tree.column('category', width=200)
+        self.category_tree.column('#0', width=200)
         self.category_tree.column('amount', width=150)
 
         self.category_tree.pack(fill='both', expand=True, padx=10, pady=10)
@@ -498,6 +657,123 @@ class FinanceApp:
         ttk.Button(balance_tab, text="Gerar Relatório em PDF",
                   command=self.generate_pdf).pack(pady=10)
 
+    def create_dashboard_tab(self):
+        """Cria a aba do painel consolidado de todos os clientes"""
+        dashboard_tab = ttk.Frame(self.notebook)
+        self.notebook.add(dashboard_tab, text="Painel Consolidado")
+
+        # Frame de totais
+        totals_frame = ttk.LabelFrame(dashboard_tab, text="Totais")
+        totals_frame.pack(pady=10, padx=10, fill='x')
+
+        self.dashboard_labels = {}
+        titulos = (('clientes', "Clientes:"), ('transacoes', "Transações:"),
+                   ('receitas', "Receitas:"), ('despesas', "Despesas:"),
+                   ('saldo', "Saldo:"), ('ultima_importacao', "Última importação:"))
+        for i, (chave, titulo) in enumerate(titulos):
+            ttk.Label(totals_frame, text=titulo).grid(row=i // 2, column=(i % 2) * 2, sticky='e', padx=5, pady=5)
+            self.dashboard_labels[chave] = ttk.Label(totals_frame, text="-")
+            self.dashboard_labels[chave].grid(row=i // 2, column=(i % 2) * 2 + 1, sticky='w', padx=5, pady=5)
+
+        # Principais categorias
+        category_frame = ttk.LabelFrame(dashboard_tab, text="Principais Categorias")
+        category_frame.pack(pady=10, padx=10, fill='both', expand=True)
+
+        self.dashboard_category_tree = ttk.Treeview(category_frame, columns=('category', 'amount'),
+                                                    show='headings', height=6)
+        self.dashboard_category_tree.heading('category', text='Categoria')
+        self.dashboard_category_tree.heading('amount', text='Valor')
+        self.dashboard_category_tree.pack(fill='both', expand=True, padx=10, pady=10)
+
+        # Clientes com saldo negativo
+        negative_frame = ttk.LabelFrame(dashboard_tab, text="Clientes com Saldo Negativo")
+        negative_frame.pack(pady=10, padx=10, fill='both', expand=True)
+
+        columns = ('id', 'nome', 'saldo', 'ultima_importacao')
+        self.dashboard_negative_tree = ttk.Treeview(negative_frame, columns=columns, show='headings', height=6)
+        self.dashboard_negative_tree.heading('id', text='ID')
+        self.dashboard_negative_tree.heading('nome', text='Nome')
+        self.dashboard_negative_tree.heading('saldo', text='Saldo')
+        self.dashboard_negative_tree.heading('ultima_importacao', text='Última Importação')
+        self.dashboard_negative_tree.column('id', width=50)
+        self.dashboard_negative_tree.pack(fill='both', expand=True, padx=10, pady=10)
+
+        # Botão e status da atualização
+        button_frame = ttk.Frame(dashboard_tab)
+        button_frame.pack(pady=10)
+
+        ttk.Button(button_frame, text="Atualizar Painel",
+                  command=self.atualizar_painel).pack(side='left', padx=5)
+
+        self.dashboard_status_label = ttk.Label(button_frame, text="")
+        self.dashboard_status_label.pack(side='left', padx=5)
+
+    def atualizar_painel(self):
+        """Recalcula o painel em segundo plano, apenas para os clientes alterados"""
+        if self.painel_em_andamento:
+            return  # Ignora cliques repetidos até a atualização atual terminar
+
+        # A fotografia é montada aqui; a thread só calcula e não altera os clientes
+        itens = painel.preparar(self.clientes)
+        executor = ThreadPoolExecutor(max_workers=1)
+        futuro = executor.submit(painel.recalcular, itens)
+        executor.shutdown(wait=False)
+        self.painel_em_andamento = True
+        self.dashboard_status_label.config(text="Atualizando...")
+        self.root.after(100, self.verificar_painel, futuro, len(itens), time.perf_counter())
+
+    def verificar_painel(self, futuro, recalculados, inicio):
+        """Aguarda o cálculo do painel sem bloquear a interface e aplica o resultado"""
+        if not futuro.done():
+            self.root.after(100, self.verificar_painel, futuro, recalculados, inicio)
+            return
+
+        self.painel_em_andamento = False
+        try:
+            painel.aplicar(self.clientes, futuro.result())
+        except Exception as e:
+            self.dashboard_status_label.config(text="")
+            messagebox.showerror("Erro", f"Falha ao atualizar painel: {str(e)}")
+            return
+
+        resultado = painel.consolidar(self.clientes)
+
+        totais = resultado['totais']
+        self.dashboard_labels['clientes'].config(text=str(totais['clientes']))
+        self.dashboard_labels['transacoes'].config(text=str(totais['transacoes']))
+        self.dashboard_labels['receitas'].config(text=f"R$ {totais['receitas']:,.2f}")
+        self.dashboard_labels['despesas'].config(text=f"R$ {totais['despesas']:,.2f}")
+        self.dashboard_labels['saldo'].config(text=relatorios.formatar_valor(totais['saldo']))
+        ultima = resultado['ultima_importacao']
+        self.dashboard_labels['ultima_importacao'].config(
+            text=ultima.strftime('%d/%m/%Y %H:%M') if ultima else "Nenhuma")
+
+        for item in self.dashboard_category_tree.get_children():
+            self.dashboard_category_tree.delete(item)
+        itens, outros = resultado['categorias']
+        for cat, amount in itens:
+            self.dashboard_category_tree.insert('', 'end', values=(cat, relatorios.formatar_valor(amount)))
+        if outros:
+            self.dashboard_category_tree.insert('', 'end', values=(
+                f"Outros ({outros['quantidade']})", relatorios.formatar_valor(outros['valor'])))
+
+        for item in self.dashboard_negative_tree.get_children():
+            self.dashboard_negative_tree.delete(item)
+        for cliente_id, nome, saldo, ultima in resultado['negativos']:
+            self.dashboard_negative_tree.insert('', 'end', values=(
+                cliente_id,
+                nome,
+                relatorios.formatar_valor(saldo),
+                ultima.strftime('%d/%m/%Y') if ultima else "-"
+            ))
+
+        self.dashboard_status_label.config(
+            text=f"Atualizado em {time.perf_counter() - inicio:.2f}s "
+                 f"({recalculados} clientes recalculados)")
+
+        # Saldos recalculados também aparecem na lista de clientes
+        self.update_client_list()
+
     def import_ofx(self):
         if not self.verificar_conta_selecionada():
             return
@@ -518,28 +794,27 @@ class FinanceApp:
                 ofx = ofxparse.OfxParser.parse(file)
 
             conta = self.clientes[self.cliente_atual]['contas'][self.conta_atual]
-            transactions = []
-
-            for t in ofx.account.statement.transactions:
-                trans_data = {
-                    'date': t.date,
-                    'amount': float(t.amount),
-                    'type': 'CREDIT' if float(t.amount) > 0 else 'DEBIT',
-                    'memo': t.memo,
-                    'category': 'Não categorizado'
-                }
-                transactions.append(trans_data)
-
-            conta['transactions'].extend(transactions)
-            
-            # Atualiza período
-            if not conta['periodos']['inicio']:
-                conta['periodos']['inicio'] = min(t['date'] for t in transactions)
-            conta['periodos']['fim'] = max(t['date'] for t in transactions)
+            lidas = dados.converter_transacoes(ofx.account)
+            # Ignora as transações já importadas (ex.: pelo serviço de ingestão)
+            transactions = dados.transacoes_novas(conta, lidas)
+            repetidas = len(lidas) - len(transactions)
+            periodos_anteriores = dict(conta['periodos'])
+            ultima_importacao_anterior = conta.get('ultima_importacao')
+
+            # Atualiza período, balanço e índices apenas com as novas transações
+            inicio = dados.aplicar_transacoes(self.clientes[self.cliente_atual], self.conta_atual, transactions)
+            if transactions:
+                self.historico.registrar(historico.Importacao(
+                    self.cliente_atual, self.conta_atual, inicio, periodos_anteriores,
+                    ultima_importacao_anterior))
 
-            self.calcular_balanco()
+            self.update_balance_view()
             self.update_account_list()
-            messagebox.showinfo("Sucesso", f"Importadas {len(transactions)} transações")
+            self.update_client_list()
+            mensagem = f"Importadas {len(transactions)} transações"
+            if repetidas:
+                mensagem += f"\n{repetidas} transações já importadas foram ignoradas"
+            messagebox.showinfo("Sucesso", mensagem)
 
         except Exception as e:
             messagebox.showerror("Erro", f"Falha ao importar: {str(e)}")
@@ -573,9 +848,14 @@ class FinanceApp:
 
         cliente = self.clientes[self.cliente_atual]
         balance_data = cliente['balance_data']
-        transactions = cliente['transactions']
+        transactions = [trans for conta in cliente['contas'].values() for trans in conta['transactions']]
 
         try:
+            if self.pasta_arquivo():
+                # Exercícios arquivados são lidos do arquivo, antes das transações vivas
+                arquivadas = arquivo.entradas_arquivadas(self.pasta_arquivo(), self.cliente_atual, cliente)
+                transactions = [trans for *_, trans in arquivadas] + transactions
+
             # Criar estrutura XML
             root = ET.Element('financeiro')
             ET.SubElement(root, 'cliente_id').text = self.cliente_atual
@@ -587,12 +867,9 @@ class FinanceApp:
             ET.SubElement(balance, 'despesas').text = str(balance_data['despesas'])
             ET.SubElement(balance, 'saldo').text = str(balance_data['saldo'])
 
-            # Adicionar categorias
+            # Adicionar categorias (maiores de cada nível, demais em <outros>)
             categories = ET.SubElement(root, 'categorias')
-            for cat, amount in balance_data['categorias'].items():
-                category = ET.SubElement(categories, 'categoria')
-                ET.SubElement(category, 'nome').text = cat
-                ET.SubElement(category, 'valor').text = str(amount)
+            self.adicionar_categorias_xml(categories, dados.ranking_hierarquico(balance_data))
 
             # Adicionar transações
             transactions_xml = ET.SubElement(root, 'transacoes')
@@ -626,6 +903,19 @@ class FinanceApp:
         except Exception as e:
             messagebox.showerror("Erro", f"Falha ao salvar XML: {str(e)}")
 
+    def adicionar_categorias_xml(self, elemento, ranking):
+        """Adiciona ao XML um nível do ranking de categorias, com as subcategorias aninhadas"""
+        for item in ranking['itens']:
+            category = ET.SubElement(elemento, 'categoria')
+            ET.SubElement(category, 'nome').text = item['nome']
+            ET.SubElement(category, 'valor').text = str(item['valor'])
+            self.adicionar_categorias_xml(category, item)
+
+        if ranking['outros']:
+            outros = ET.SubElement(elemento, 'outros')
+            ET.SubElement(outros, 'quantidade').text = str(ranking['outros']['quantidade'])
+            ET.SubElement(outros, 'valor').text = str(ranking['outros']['valor'])
+
     def update_account_list(self):
         """Atualiza a lista de contas na interface"""
         if not self.cliente_atual:
@@ -658,18 +948,48 @@ class FinanceApp:
         if not self.cliente_atual or 'contas' not in self.clientes[self.cliente_atual]:
             return
 
-        for conta_id, conta in self.clientes[self.cliente_atual]['contas'].items():
-            for trans in conta['transactions']:
-                amount = trans['amount']
-                amount_str = f"R$ {abs(amount):,.2f}"
-                
-                self.transaction_tree.insert('', 'end', values=(
-                    trans['date'].strftime('%d/%m/%Y'),
-                    f"{conta['banco']} - {trans['memo']}",
-                    amount_str,
-                    trans['type'],
-                    trans['category']
-                ))
+        cliente = self.clientes[self.cliente_atual]
+        contas = cliente['contas']
+
+        if self.coluna_ordenacao:
+            # Percorre o índice já ordenado, sem reordenar os itens do Treeview
+            indice = dados.obter_indices(cliente)[self.coluna_ordenacao]
+            ordem = reversed(indice) if self.ordem_decrescente else indice
+            posicoes = ((conta_id, pos) for _, conta_id, pos in ordem)
+        else:
+            posicoes = ((conta_id, pos)
+                        for conta_id, conta in contas.items()
+                        for pos in range(len(conta['transactions'])))
+
+        for conta_id, pos in posicoes:
+            conta = contas[conta_id]
+            trans = conta['transactions'][pos]
+            amount = trans['amount']
+            amount_str = f"R$ {abs(amount):,.2f}"
+
+            self.transaction_tree.insert('', 'end', iid=f"{conta_id}:{pos}", values=(
+                trans['date'].strftime('%d/%m/%Y'),
+                f"{conta['banco']} - {trans['memo']}",
+                amount_str,
+                trans['type'],
+                trans['category']
+            ))
+
+    def ordenar_transacoes(self, coluna):
+        """Ordena a visualização pela coluna clicada, alternando o sentido"""
+        if self.coluna_ordenacao == coluna:
+            self.ordem_decrescente = not self.ordem_decrescente
+        else:
+            self.coluna_ordenacao = coluna
+            self.ordem_decrescente = False
+
+        # Indica a coluna e o sentido da ordenação nos cabeçalhos
+        for col, titulo in self.titulos_transacoes.items():
+            if col == coluna:
+                titulo += ' ▼' if self.ordem_decrescente else ' ▲'
+            self.transaction_tree.heading(col, text=titulo)
+
+        self.update_transaction_view()
 
     def calcular_balanco(self):
         """Calcula o balanço consolidado de todas as contas do cliente atual"""
@@ -677,35 +997,11 @@ class FinanceApp:
             return
 
         cliente = self.clientes[self.cliente_atual]
-        saldo_total = {
-            'receitas': 0,
-            'despesas': 0,
-            'saldo': 0,
-            'categorias': {}
-        }
-
-        # Zera os valores antes de recalcular
-        cliente['balance_data'] = saldo_total.copy()
 
         if 'contas' not in cliente:
             cliente['contas'] = {}
 
-        for conta in cliente['contas'].values():
-            for trans in conta['transactions']:
-                valor = trans['amount']
-                if valor > 0:
-                    saldo_total['receitas'] += valor
-                else:
-                    saldo_total['despesas'] += abs(valor)
-                
-                saldo_total['saldo'] += valor
-                
-                categoria = trans['category']
-                if categoria not in saldo_total['categorias']:
-                    saldo_total['categorias'][categoria] = 0
-                saldo_total['categorias'][categoria] += valor
-
-        cliente['balance_data'] = saldo_total
+        dados.calcular_balanco(cliente)
         self.update_balance_view()
 
     def update_balance_view(self):
@@ -717,6 +1013,10 @@ class FinanceApp:
 
             for item in self.category_tree.get_children():
                 self.category_tree.delete(item)
+            for item in self.flow_tree.get_children():
+                self.flow_tree.delete(item)
+            for item in self.archive_tree.get_children():
+                self.archive_tree.delete(item)
             return
 
         cliente = self.clientes[self.cliente_atual]
@@ -730,9 +1030,44 @@ class FinanceApp:
         for item in self.category_tree.get_children():
             self.category_tree.delete(item)
 
-        for cat, amount in balance_data['categorias'].items():
+        # Maiores categorias de cada nível (seleção por heap), demais em "Outros"
+        pais = {0: ''}
+        for nivel, rotulo, amount, nome in dados.percorrer_ranking(dados.ranking_hierarquico(balance_data)):
             amount_str = f"R$ {amount:,.2f}" if amount >= 0 else f"-R$ {abs(amount):,.2f}"
-            self.category_tree.insert('', 'end', values=(cat, amount_str))
+            item = self.category_tree.insert(pais[nivel], 'end', text=rotulo, values=(amount_str,))
+            pais[nivel + 1] = item
+
+        # Atualizar fluxo de caixa (recalculado apenas para contas alteradas)
+        for item in self.flow_tree.get_children():
+            self.flow_tree.delete(item)
+
+        for conta_id, valores in analise.resumo_fluxo(cliente).items():
+            conta = cliente['contas'][conta_id]
+            self.flow_tree.insert('', 'end', values=(
+                f"{conta['banco']} ({conta['numero']})",
+                valores['dia'].strftime('%d/%m/%Y'),
+                relatorios.formatar_valor(valores['saldo']),
+                relatorios.formatar_valor(valores['media_saldo']),
+                relatorios.formatar_valor(valores['receitas_30']),
+                relatorios.formatar_valor(valores['despesas_30']),
+                relatorios.formatar_valor(valores['receitas_90']),
+                relatorios.formatar_valor(valores['despesas_90'])
+            ))
+
+        # Atualizar exercícios arquivados
+        for item in self.archive_tree.get_children():
+            self.archive_tree.delete(item)
+
+        for conta in cliente['contas'].values():
+            for ano, resumo in sorted(conta.get('arquivados', {}).items()):
+                self.archive_tree.insert('', 'end', values=(
+                    f"{conta['banco']} ({conta['numero']})",
+                    ano,
+                    resumo['transacoes'],
+                    relatorios.formatar_valor(resumo['receitas']),
+                    relatorios.formatar_valor(resumo['despesas']),
+                    relatorios.formatar_valor(resumo['saldo'])
+                ))
 
     def open_detailed_view(self):
         """Abre uma janela com a visualização detalhada da transação selecionada"""
@@ -762,6 +1097,157 @@ class FinanceApp:
 
         ttk.Button(detail_window, text="Fechar", command=detail_window.destroy).pack(pady=10)
 
+    def abrir_base(self):
+        """Abre uma base de clientes salva"""
+        filepath = filedialog.askopenfilename(
+            filetypes=(("Base de clientes", "*.pkl"), ("All files", "*.*")),
+            title="Abrir Base"
+        )
+        if filepath:
+            self.carregar_base(filepath)
+
+    def carregar_base(self, caminho):
+        """Carrega clientes e checkpoint de ingestão da base informada"""
+        try:
+            mtime = armazenamento.mtime_base(caminho)
+            self.clientes, self.checkpoint_ingestao = armazenamento.carregar_base(caminho)
+        except Exception as e:
+            messagebox.showerror("Erro", f"Falha ao abrir base: {str(e)}")
+            return
+
+        self.caminho_base = caminho
+        self.mtime_base = mtime
+        self.historico.limpar()
+        self.cliente_atual = None
+        self.conta_atual = None
+        self.root.title("Sistema de Balanço Financeiro")
+        self.status_conta_label.config(text="Conta selecionada: Nenhuma")
+        self.base_label.config(text=f"Base: {caminho}")
+
+        for item in self.account_tree.get_children():
+            self.account_tree.delete(item)
+
+        self.update_client_list()
+        self.update_transaction_view()
+        self.update_balance_view()
+
+    def salvar_base(self):
+        """Salva todos os clientes na base, preservando o checkpoint da ingestão"""
+        if not self.caminho_base:
+            filepath = filedialog.asksaveasfilename(
+                defaultextension=".pkl",
+                filetypes=(("Base de clientes", "*.pkl"), ("All files", "*.*")),
+                title="Salvar Base"
+            )
+            if not filepath:
+                return
+            self.caminho_base = filepath
+            # Sobrescrever um arquivo existente já foi confirmado na caixa de diálogo
+            self.mtime_base = armazenamento.mtime_base(filepath)
+
+        try:
+            try:
+                self.mtime_base = armazenamento.salvar_base(
+                    self.caminho_base, self.clientes, self.checkpoint_ingestao, mtime_esperado=self.mtime_base)
+            except armazenamento.ErroBaseAlterada:
+                # Ex.: o serviço de ingestão importou arquivos desde que a base foi aberta
+                if not messagebox.askyesno(
+                        "Base alterada",
+                        "A base foi alterada por outro processo desde que foi aberta.\n"
+                        "Salvar assim mesmo descarta essas alterações. Continuar?"):
+                    return
+                self.mtime_base = armazenamento.salvar_base(
+                    self.caminho_base, self.clientes, self.checkpoint_ingestao)
+            self.base_label.config(text=f"Base: {self.caminho_base}")
+            messagebox.showinfo("Sucesso", f"Base salva em {self.caminho_base}")
+        except Exception as e:
+            messagebox.showerror("Erro", f"Falha ao salvar base: {str(e)}")
+
+    def editar_categoria(self):
+        """Altera a categoria das transações selecionadas na visualização"""
+        selected = self.transaction_tree.selection()
+        if not self.cliente_atual or not selected:
+            messagebox.showwarning("Aviso", "Selecione uma ou mais transações para editar")
+            return
+
+        categoria = simpledialog.askstring("Editar Categoria", "Nova categoria:", parent=self.root)
+        if not categoria or not categoria.strip():
+            return
+        categoria = categoria.strip()
+
+        cliente = self.clientes[self.cliente_atual]
+        alteracoes = []
+        for iid in selected:
+            conta_id, pos = iid.rsplit(':', 1)
+            alteracoes.append((conta_id, int(pos), categoria))
+
+        anteriores = [
+            (conta_id, pos, anterior)
+            for (conta_id, pos, _), anterior in zip(alteracoes, dados.alterar_categorias(cliente, alteracoes))
+            if anterior != categoria
+        ]
+
+        if anteriores:
+            self.historico.registrar(historico.EdicaoCategoria(self.cliente_atual, categoria, anteriores))
+
+        self.update_transaction_view()
+        self.update_balance_view()
+
+    def desfazer(self):
+        """Desfaz a última importação, remoção ou edição de categoria"""
+        try:
+            descricao = self.historico.desfazer(self.clientes)
+        except Exception as e:
+            messagebox.showerror("Erro", f"Falha ao desfazer: {str(e)}")
+            return
+
+        if descricao:
+            self.atualizar_apos_historico(f"Desfeito: {descricao}")
+
+    def refazer(self):
+        """Refaz a última operação desfeita"""
+        try:
+            descricao = self.historico.refazer(self.clientes)
+        except Exception as e:
+            messagebox.showerror("Erro", f"Falha ao refazer: {str(e)}")
+            return
+
+        if descricao:
+            self.atualizar_apos_historico(f"Refeito: {descricao}")
+
+    def atualizar_apos_historico(self, mensagem):
+        """Atualiza seleção e visualizações após desfazer ou refazer"""
+        if self.cliente_atual not in self.clientes:
+            self.cliente_atual = None
+            self.root.title("Sistema de Balanço Financeiro")
+        if not self.cliente_atual or self.conta_atual not in self.clientes[self.cliente_atual]['contas']:
+            self.conta_atual = None
+            self.status_conta_label.config(text="Conta selecionada: Nenhuma")
+
+        for item in self.account_tree.get_children():
+            self.account_tree.delete(item)
+
+        self.update_client_list()
+        self.update_account_list()
+        self.update_transaction_view()
+        self.update_balance_view()
+        self.status_label.config(text=mensagem)
+
+    def pasta_arquivo(self):
+        """Pasta do arquivo de exercícios da base aberta, ou None se ela ainda não foi salva"""
+        return arquivo.pasta_arquivo(self.caminho_base) if self.caminho_base else None
+
+    def iniciar_api(self, porta):
+        """Inicia a API local de consulta sobre os clientes desta janela"""
+        try:
+            self.servidor_api = servidor.ServidorConsulta(
+                lambda: self.clientes, porta=porta, obter_pasta_arquivo=self.pasta_arquivo)
+            porta = self.servidor_api.iniciar_em_thread()
+            self.status_label.config(text=f"API local em http://127.0.0.1:{porta}/clientes")
+        except Exception as e:
+            self.servidor_api = None
+            messagebox.showerror("Erro", f"Falha ao iniciar API local: {str(e)}")
+
     def create_filters(self):
         """Cria controles para filtros"""
         filter_frame = ttk.Frame(self.view_tab)  # Assumindo que view_tab é sua aba de visualização
@@ -799,49 +1285,9 @@ class FinanceApp:
             return
 
         cliente = self.clientes[self.cliente_atual]
-        balance_data = cliente['balance_data']
 
         try:
-            pdf = FPDF()
-            pdf.add_page()
-            pdf.set_font("Arial", size=12)
-
-            # Título
-            pdf.cell(200, 10, txt="Relatório Financeiro", ln=1, align='C')
-            pdf.ln(10)
-
-            # Data do relatório
-            pdf.cell(200, 10, txt=f"Data: {datetime.now().strftime('%d/%m/%Y %H:%M')}", ln=1)
-            pdf.ln(5)
-
-            # Nome do cliente
-            pdf.cell(200, 10, txt=f"Cliente: {cliente['nome']}", ln=1)
-            pdf.ln(5)
-
-            # Resumo
-            pdf.set_font("Arial", 'B', size=12)
-            pdf.cell(200, 10, txt="Resumo Financeiro", ln=1)
-            pdf.set_font("Arial", size=12)
-
-            pdf.cell(100, 10, txt="Receitas:", ln=0)
-            pdf.cell(50, 10, txt=f"R$ {balance_data['receitas']:,.2f}", ln=1)
-
-            pdf.cell(100, 10, txt="Despesas:", ln=0)
-            pdf.cell(50, 10, txt=f"R$ {balance_data['despesas']:,.2f}", ln=1)
-
-            pdf.cell(100, 10, txt="Saldo:", ln=0)
-            pdf.cell(50, 10, txt=f"R$ {balance_data['saldo']:,.2f}", ln=1)
-            pdf.ln(10)
-
-            # Categorias
-            pdf.set_font("Arial", 'B', size=12)
-            pdf.cell(200, 10, txt="Por Categoria", ln=1)
-            pdf.set_font("Arial", size=12)
-
-            for cat, amount in balance_data['categorias'].items():
-                amount_str = f"R$ {amount:,.2f}" if amount >= 0 else f"-R$ {abs(amount):,.2f}"
-                pdf.cell(120, 10, txt=cat, ln=0)
-                pdf.cell(50, 10, txt=amount_str, ln=1)
+            pdf = relatorios.gerar_relatorio_pdf(cliente)
 
             # Salvar arquivo
             filepath = filedialog.asksaveasfilename(
@@ -857,8 +1303,57 @@ class FinanceApp:
         except Exception as e:
             messagebox.showerror("Erro", f"Falha ao gerar PDF: {str(e)}")
 
+    def gerar_relatorios_lote(self):
+        """Gera os relatórios dos clientes selecionados (ou de todos) em uma pasta"""
+        if not self.clientes:
+            messagebox.showwarning("Aviso", "Nenhum cliente cadastrado")
+            return
+
+        ids = [str(self.client_tree.item(item)['values'][0]) for item in self.client_tree.selection()]
+        pasta = filedialog.askdirectory(title="Pasta de saída dos relatórios")
+        if not pasta:
+            return
+
+        apendice = messagebox.askyesno("Apêndice", "Incluir apêndice com todas as transações?")
+        itens = relatorios.preparar_lote(self.clientes, ids)
+        quantidade = len(itens)
+
+        # Executa em segundo plano para não bloquear a interface
+        executor = ThreadPoolExecutor(max_workers=1)
+        futuro = executor.submit(relatorios.gerar_relatorios_lote, itens, pasta, apendice,
+                                 pasta_raiz=self.pasta_arquivo())
+        executor.shutdown(wait=False)
+        self.status_label.config(text=f"Gerando {quantidade} relatórios...")
+        self.root.after(200, self.verificar_relatorios_lote, futuro, pasta)
+
+    def verificar_relatorios_lote(self, futuro, pasta):
+        """Aguarda o término da geração em lote sem bloquear a interface"""
+        if not futuro.done():
+            self.root.after(200, self.verificar_relatorios_lote, futuro, pasta)
+            return
+
+        try:
+            resumos = futuro.result()
+        except Exception as e:
+            self.status_label.config(text="Falha na geração dos relatórios")
+            messagebox.showerror("Erro", f"Falha ao gerar relatórios: {str(e)}")
+            return
+
+        erros = [r for r in resumos if r['erro']]
+        paginas = sum(r['paginas'] for r in resumos)
+        self.status_label.config(text=f"Relatórios salvos em {pasta}")
+        messagebox.showinfo("Sucesso",
+            f"{len(resumos) - len(erros)} relatórios gerados ({paginas} páginas)\n"
+            f"Erros: {len(erros)}\n"
+            f"Resumo em {relatorios.ARQUIVO_RESUMO}")
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sistema de Balanço Financeiro")
+    parser.add_argument('--base', help="Arquivo da base de clientes a abrir")
+    parser.add_argument('--api', type=int, metavar='PORTA', help="Inicia a API local de consulta na porta")
+    args = parser.parse_args()
+
     root = tk.Tk()
-    app = FinanceApp(root)
+    app = FinanceApp(root, caminho_base=args.base, porta_api=args.api)
     root.mainloop()
@@ -0,0 +1,143 @@
+"""Painel consolidado de todos os clientes
+
+Os agregados de cada cliente ficam em cliente['agregados'], junto com a
+versão do cliente em que foram calculados (ver dados.marcar_alterado). Só os
+clientes sem agregados ou com versão diferente têm o balanço recalculado, em
+um pool de processos quando são muitos; os demais entram direto do cache.
+
+Na interface, preparar, aplicar e consolidar rodam na thread da interface,
+que é a única que altera os clientes; só recalcular roda em segundo plano,
+sobre a fotografia montada por preparar.
+"""
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import dados
+
+MINIMO_PARALELO = 50  # Abaixo disso, iniciar processos custa mais que recalcular
+CLIENTES_POR_TAREFA = 25
+
+
+def agregados_cliente(cliente):
+    """Agregados baratos do cliente: total de transações e última importação"""
+    contas = cliente.get('contas', {}).values()
+    importacoes = [conta['ultima_importacao'] for conta in contas if conta.get('ultima_importacao')]
+    return {
+        'versao': cliente.get('versao', 0),
+        'transacoes': sum(
+            len(conta['transactions']) + sum(r['transacoes'] for r in conta.get('arquivados', {}).values())
+            for conta in contas
+        ),
+        'ultima_importacao': max(importacoes, default=None)
+    }
+
+
+def agregar_lote(itens):
+    """Recalcula balanço e agregados de um lote de clientes; executada nos processos do pool"""
+    resultados = []
+    for cliente_id, cliente in itens:
+        balance_data = dados.calcular_balanco(cliente)
+        resultados.append((cliente_id, balance_data, agregados_cliente(cliente)))
+    return resultados
+
+
+def dados_para_agregar(cliente):
+    """Apenas o necessário para recalcular o cliente, sem índices nem caches"""
+    return {
+        'versao': cliente.get('versao', 0),
+        'contas': {
+            conta_id: {
+                'transactions': list(conta['transactions']),
+                'arquivados': dict(conta.get('arquivados', {})),
+                'ultima_importacao': conta.get('ultima_importacao')
+            }
+            for conta_id, conta in list(cliente.get('contas', {}).items())
+        }
+    }
+
+
+def clientes_sujos(clientes):
+    return [
+        cliente_id for cliente_id, cliente in list(clientes.items())
+        if cliente.get('agregados', {}).get('versao') != cliente.get('versao', 0)
+    ]
+
+
+def preparar(clientes):
+    """Fotografia dos clientes a recalcular, montada na thread que altera os clientes"""
+    return [(cliente_id, dados_para_agregar(clientes[cliente_id])) for cliente_id in clientes_sujos(clientes)]
+
+
+def recalcular(itens, workers=None):
+    """Recalcula balanço e agregados dos clientes preparados, sem alterar os clientes
+
+    Pode rodar em segundo plano. Retorna a lista de (cliente_id, balance_data, agregados).
+    """
+    if len(itens) < MINIMO_PARALELO:
+        return agregar_lote(itens)
+
+    lotes = [itens[i:i + CLIENTES_POR_TAREFA] for i in range(0, len(itens), CLIENTES_POR_TAREFA)]
+    # spawn: o pool pode ser criado fora da thread principal (ex.: pela interface)
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=contexto) as executor:
+        return [r for lote in executor.map(agregar_lote, lotes) for r in lote]
+
+
+def aplicar(clientes, resultados):
+    """Guarda balanço e agregados recalculados nos clientes"""
+    for cliente_id, balance_data, agregados in resultados:
+        cliente = clientes.get(cliente_id)
+        # Cliente alterado durante o cálculo continua sujo e é recalculado na próxima vez
+        if cliente is None or cliente.get('versao', 0) != agregados['versao']:
+            continue
+        cliente['balance_data'] = balance_data
+        cliente['agregados'] = agregados
+
+
+def consolidar(clientes):
+    """Consolida totais, principais categorias, clientes com saldo negativo e última importação"""
+    totais = {'clientes': 0, 'transacoes': 0, 'receitas': 0, 'despesas': 0, 'saldo': 0}
+    categorias = {}
+    negativos = []
+    ultima_importacao = None
+
+    for cliente_id, cliente in clientes.items():
+        balance_data = cliente['balance_data']
+        agregados = cliente.get('agregados') or agregados_cliente(cliente)
+
+        totais['clientes'] += 1
+        totais['transacoes'] += agregados['transacoes']
+        for chave in ('receitas', 'despesas', 'saldo'):
+            totais[chave] += balance_data[chave]
+
+        for categoria, valor in balance_data['categorias'].items():
+            categorias[categoria] = categorias.get(categoria, 0) + valor
+
+        if balance_data['saldo'] < 0:
+            negativos.append((cliente_id, cliente['nome'], balance_data['saldo'], agregados['ultima_importacao']))
+
+        if agregados['ultima_importacao'] and (
+                ultima_importacao is None or agregados['ultima_importacao'] > ultima_importacao):
+            ultima_importacao = agregados['ultima_importacao']
+
+    negativos.sort(key=lambda item: item[2])
+
+    return {
+        'totais': totais,
+        'categorias': dados.ranking_categorias(categorias),
+        'negativos': negativos,
+        'ultima_importacao': ultima_importacao
+    }
+
+
+def calcular_painel(clientes, workers=None):
+    """Recalcula os clientes alterados e consolida o painel, tudo na thread que chama"""
+    inicio = time.perf_counter()
+    itens = preparar(clientes)
+    aplicar(clientes, recalcular(itens, workers))
+
+    resultado = consolidar(clientes)
+    resultado['recalculados'] = len(itens)
+    resultado['segundos'] = time.perf_counter() - inicio
+    return resultado
@@ -0,0 +1,354 @@
+"""Geração de relatórios em PDF, individuais ou em lote
+
+Uso em lote, sem interface:
+    python relatorios.py --base base.pkl --saida PASTA [--clientes 1 2 ...] [--apendice] [--workers N]
+
+O apêndice inclui as transações dos exercícios arquivados quando a pasta do
+arquivo (arquivo.pasta_arquivo) é informada.
+"""
+import argparse
+import copy
+import csv
+import heapq
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from operator import itemgetter
+
+from fpdf import FPDF
+
+import analise
+import armazenamento
+import arquivo
+import dados
+
+ARQUIVO_RESUMO = 'resumo.csv'
+
+
+def formatar_valor(amount):
+    return f"R$ {amount:,.2f}" if amount >= 0 else f"-R$ {abs(amount):,.2f}"
+
+
+def texto_pdf(texto):
+    """Substitui caracteres que as fontes padrão do FPDF (latin-1) não suportam"""
+    return str(texto or '').encode('latin-1', 'replace').decode('latin-1')
+
+
+def gerar_relatorio_pdf(cliente, apendice=False, cliente_id=None, pasta_raiz=None):
+    """Monta o relatório financeiro de um cliente e retorna o objeto FPDF"""
+    balance_data = cliente['balance_data']
+
+    pdf = FPDF()
+    pdf.set_auto_page_break(True, margin=15)
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+
+    # Título
+    pdf.cell(200, 10, txt="Relatório Financeiro", ln=1, align='C')
+    pdf.ln(10)
+
+    # Data do relatório
+    pdf.cell(200, 10, txt=f"Data: {datetime.now().strftime('%d/%m/%Y %H:%M')}", ln=1)
+    pdf.ln(5)
+
+    # Nome do cliente
+    pdf.cell(200, 10, txt=texto_pdf(f"Cliente: {cliente['nome']}"), ln=1)
+    pdf.ln(5)
+
+    # Resumo
+    pdf.set_font("Arial", 'B', size=12)
+    pdf.cell(200, 10, txt="Resumo Financeiro", ln=1)
+    pdf.set_font("Arial", size=12)
+
+    pdf.cell(100, 10, txt="Receitas:", ln=0)
+    pdf.cell(50, 10, txt=f"R$ {balance_data['receitas']:,.2f}", ln=1)
+
+    pdf.cell(100, 10, txt="Despesas:", ln=0)
+    pdf.cell(50, 10, txt=f"R$ {balance_data['despesas']:,.2f}", ln=1)
+
+    pdf.cell(100, 10, txt="Saldo:", ln=0)
+    pdf.cell(50, 10, txt=f"R$ {balance_data['saldo']:,.2f}", ln=1)
+    pdf.ln(10)
+
+    # Categorias
+    pdf.set_font("Arial", 'B', size=12)
+    pdf.cell(200, 10, txt="Por Categoria", ln=1)
+    pdf.set_font("Arial", size=12)
+
+    # Maiores categorias de cada nível, com as subcategorias recuadas
+    for nivel, rotulo, amount, _ in dados.percorrer_ranking(dados.ranking_hierarquico(balance_data)):
+        pdf.set_x(pdf.l_margin + 8 * nivel)
+        pdf.cell(120 - 8 * nivel, 10, txt=texto_pdf(rotulo), ln=0)
+        pdf.cell(50, 10, txt=formatar_valor(amount), ln=1)
+
+    adicionar_fluxo_caixa(pdf, cliente)
+    adicionar_arquivados(pdf, cliente)
+
+    if apendice:
+        adicionar_apendice(pdf, cliente, cliente_id, pasta_raiz)
+
+    return pdf
+
+
+def adicionar_fluxo_caixa(pdf, cliente):
+    """Adiciona os valores mais recentes das análises de fluxo de caixa de cada conta"""
+    resumo = analise.resumo_fluxo(cliente)
+    if not resumo:
+        return
+
+    pdf.ln(10)
+    pdf.set_font("Arial", 'B', size=12)
+    pdf.cell(200, 10, txt="Fluxo de Caixa", ln=1)
+
+    larguras = (40, 25, 25, 25, 25, 25, 25)
+    titulos = ("Conta", "Saldo", "Média 30d", "Rec. 30d", "Desp. 30d", "Rec. 90d", "Desp. 90d")
+    pdf.set_font("Arial", 'B', size=9)
+    for largura, titulo in zip(larguras, titulos):
+        pdf.cell(largura, 6, txt=titulo, border='B', ln=0)
+    pdf.ln(6)
+
+    pdf.set_font("Arial", size=9)
+    for conta_id, valores in resumo.items():
+        conta = cliente['contas'][conta_id]
+        linha = (
+            texto_pdf(f"{conta['banco']} ({conta['numero']})")[:22],
+            formatar_valor(valores['saldo']),
+            formatar_valor(valores['media_saldo']),
+            formatar_valor(valores['receitas_30']),
+            formatar_valor(valores['despesas_30']),
+            formatar_valor(valores['receitas_90']),
+            formatar_valor(valores['despesas_90'])
+        )
+        for largura, valor in zip(larguras, linha):
+            pdf.cell(largura, 6, txt=valor, ln=0)
+        pdf.ln(6)
+    pdf.set_font("Arial", size=12)
+
+
+def adicionar_arquivados(pdf, cliente):
+    """Adiciona os totais dos exercícios arquivados, lidos dos resumos já calculados"""
+    linhas = [
+        (conta, ano, resumo)
+        for conta in cliente.get('contas', {}).values()
+        for ano, resumo in sorted(conta.get('arquivados', {}).items())
+    ]
+    if not linhas:
+        return
+
+    pdf.ln(10)
+    pdf.set_font("Arial", 'B', size=12)
+    pdf.cell(200, 10, txt="Exercícios Arquivados", ln=1)
+
+    larguras = (50, 15, 25, 30, 30, 30)
+    titulos = ("Conta", "Ano", "Transações", "Receitas", "Despesas", "Saldo")
+    pdf.set_font("Arial", 'B', size=9)
+    for largura, titulo in zip(larguras, titulos):
+        pdf.cell(largura, 6, txt=titulo, border='B', ln=0)
+    pdf.ln(6)
+
+    pdf.set_font("Arial", size=9)
+    for conta, ano, resumo in linhas:
+        linha = (
+            texto_pdf(f"{conta['banco']} ({conta['numero']})")[:28],
+            str(ano),
+            str(resumo['transacoes']),
+            formatar_valor(resumo['receitas']),
+            formatar_valor(resumo['despesas']),
+            formatar_valor(resumo['saldo'])
+        )
+        for largura, valor in zip(larguras, linha):
+            pdf.cell(largura, 6, txt=valor, ln=0)
+        pdf.ln(6)
+    pdf.set_font("Arial", size=12)
+
+
+def linhas_apendice(cliente, cliente_id=None, pasta_raiz=None):
+    """Gera as linhas do apêndice em ordem de data, sem montar uma lista intermediária
+
+    Com `pasta_raiz`, as transações arquivadas são lidas do arquivo e
+    combinadas com o índice de datas das transações vivas.
+    """
+    contas = cliente.get('contas', {})
+    # Só o índice de datas é necessário (o cliente enviado ao pool não traz índices)
+    indice = dados.construir_indice(cliente, 'date')
+    entradas = ((chave, conta_id, None, pos, None) for chave, conta_id, pos in indice)
+    if pasta_raiz:
+        arquivadas = arquivo.entradas_arquivadas(pasta_raiz, cliente_id, cliente)
+        entradas = heapq.merge(arquivadas, entradas, key=itemgetter(0))
+
+    for _, conta_id, _, pos, trans in entradas:
+        conta = contas[conta_id]
+        if trans is None:
+            trans = conta['transactions'][pos]
+        yield (
+            trans['date'].strftime('%d/%m/%Y'),
+            texto_pdf(f"{conta['banco']} - {trans['memo']}")[:60],
+            formatar_valor(trans['amount']),
+            texto_pdf(trans['category'])[:30]
+        )
+
+
+def adicionar_apendice(pdf, cliente, cliente_id=None, pasta_raiz=None):
+    """Adiciona o apêndice com todas as transações, quebrando as páginas à medida que são preenchidas"""
+    larguras = (25, 95, 30, 40)
+    altura = 6
+
+    def cabecalho():
+        pdf.set_font("Arial", 'B', size=9)
+        for largura, titulo in zip(larguras, ("Data", "Descrição", "Valor", "Categoria")):
+            pdf.cell(largura, altura, txt=titulo, border='B', ln=0)
+        pdf.ln(altura)
+        pdf.set_font("Arial", size=9)
+
+    pdf.add_page()
+    pdf.set_font("Arial", 'B', size=12)
+    pdf.cell(200, 10, txt="Apêndice - Transações", ln=1)
+    cabecalho()
+
+    limite = pdf.h - pdf.b_margin - altura
+    for linha in linhas_apendice(cliente, cliente_id, pasta_raiz):
+        # Quebra a página manualmente para repetir o cabeçalho da tabela
+        if pdf.get_y() > limite:
+            pdf.add_page()
+            cabecalho()
+
+        for largura, valor in zip(larguras, linha):
+            pdf.cell(largura, altura, txt=valor, ln=0)
+        pdf.ln(altura)
+
+
+def nome_arquivo_relatorio(cliente_id, cliente):
+    nome = re.sub(r'[^\w-]+', '_', cliente['nome']).strip('_')
+    return f"{cliente_id}_{nome}.pdf"
+
+
+def salvar_relatorio(cliente_id, cliente, pasta, apendice=False, pasta_raiz=None):
+    """Gera e grava o relatório de um cliente; executada nos processos do pool
+
+    Retorna o resumo da geração (arquivo, páginas, transações e tempo).
+    """
+    inicio = time.perf_counter()
+    resumo = {
+        'cliente_id': cliente_id,
+        'nome': cliente['nome'],
+        'arquivo': '',
+        'paginas': 0,
+        'transacoes': sum(
+            len(c['transactions']) + sum(r['transacoes'] for r in c.get('arquivados', {}).values())
+            for c in cliente.get('contas', {}).values()
+        ),
+        'segundos': 0,
+        'erro': ''
+    }
+
+    try:
+        pdf = gerar_relatorio_pdf(cliente, apendice, cliente_id, pasta_raiz)
+        caminho = os.path.join(pasta, nome_arquivo_relatorio(cliente_id, cliente))
+        pdf.output(caminho)
+        resumo['arquivo'] = caminho
+        resumo['paginas'] = pdf.page_no()
+    except Exception as e:
+        resumo['erro'] = str(e)
+
+    resumo['segundos'] = round(time.perf_counter() - inicio, 3)
+    return resumo
+
+
+def dados_para_relatorio(cliente):
+    """Apenas o necessário para o relatório, sem índices nem caches"""
+    return {
+        'nome': cliente['nome'],
+        'balance_data': copy.deepcopy(cliente['balance_data']),
+        'contas': {
+            conta_id: {
+                'banco': conta['banco'],
+                'numero': conta['numero'],
+                'transactions': list(conta['transactions']),
+                'arquivados': dict(conta.get('arquivados', {}))
+            }
+            for conta_id, conta in cliente.get('contas', {}).items()
+        }
+    }
+
+
+def preparar_lote(clientes, ids=None):
+    """Fotografia dos clientes informados (ou de todos) para gerar_relatorios_lote
+
+    Deve ser montada na thread que altera os clientes (a da interface): o
+    envio aos processos do pool acontece em outra thread e não pode percorrer
+    dicionários que estão sendo alterados. IDs inexistentes ficam com None.
+    """
+    ids = list(ids) if ids else list(clientes.keys())
+    return [
+        (cliente_id, dados_para_relatorio(clientes[cliente_id]) if cliente_id in clientes else None)
+        for cliente_id in ids
+    ]
+
+
+def cliente_nao_encontrado(cliente_id):
+    return {
+        'cliente_id': cliente_id,
+        'nome': '',
+        'arquivo': '',
+        'paginas': 0,
+        'transacoes': 0,
+        'segundos': 0,
+        'erro': f"Cliente {cliente_id} não encontrado"
+    }
+
+
+def gerar_relatorios_lote(itens, pasta, apendice=False, workers=None, pasta_raiz=None):
+    """Gera em paralelo os relatórios dos clientes montados por preparar_lote
+
+    Grava também o resumo da geração em resumo.csv na pasta de saída e
+    retorna a lista de resumos, na ordem dos clientes.
+    """
+    os.makedirs(pasta, exist_ok=True)
+
+    # spawn: o pool pode ser criado fora da thread principal (ex.: pela interface)
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=contexto) as executor:
+        futuros = [
+            executor.submit(salvar_relatorio, cliente_id, cliente, pasta, apendice, pasta_raiz)
+            if cliente is not None else None
+            for cliente_id, cliente in itens
+        ]
+        resumos = [
+            futuro.result() if futuro is not None else cliente_nao_encontrado(cliente_id)
+            for (cliente_id, _), futuro in zip(itens, futuros)
+        ]
+
+    campos = ('cliente_id', 'nome', 'arquivo', 'paginas', 'transacoes', 'segundos', 'erro')
+    with open(os.path.join(pasta, ARQUIVO_RESUMO), 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=campos, delimiter=';')
+        writer.writeheader()
+        writer.writerows(resumos)
+
+    return resumos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Geração de relatórios PDF em lote")
+    parser.add_argument('--base', required=True, help="Arquivo da base de clientes")
+    parser.add_argument('--saida', required=True, help="Pasta de saída dos relatórios")
+    parser.add_argument('--clientes', nargs='*', help="IDs dos clientes (padrão: todos)")
+    parser.add_argument('--apendice', action='store_true', help="Inclui o apêndice com as transações")
+    parser.add_argument('--workers', type=int, default=None, help="Processos para geração dos PDFs")
+    args = parser.parse_args()
+
+    clientes, _ = armazenamento.carregar_base(args.base)
+    inicio = time.perf_counter()
+    itens = preparar_lote(clientes, args.clientes)
+    resumos = gerar_relatorios_lote(itens, args.saida, args.apendice, args.workers, arquivo.pasta_arquivo(args.base))
+
+    erros = [r for r in resumos if r['erro']]
+    print(f"{len(resumos) - len(erros)} relatórios gerados em {time.perf_counter() - inicio:.1f}s")
+    for resumo in erros:
+        print(f"Erro no cliente {resumo['cliente_id']}: {resumo['erro']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,514 @@
+"""API local de consulta (HTTP/JSON) sobre a base de clientes
+
+Uso, sem interface:
+    python servidor.py --base base.pkl [--porta 8765]
+
+Ou junto com a interface: python main.py --base base.pkl --api 8765
+
+O servidor roda em uma thread própria com seu laço asyncio e só escuta em
+127.0.0.1. As consultas apenas leem os dados: listas de índices substituídas
+por novas importações continuam válidas para quem já as está percorrendo, de
+modo que leituras não bloqueiam a interface nem as importações.
+
+Rotas (GET):
+    /clientes
+    /clientes/{id}
+    /clientes/{id}/contas
+    /clientes/{id}/balanco
+    /clientes/{id}/periodos?granularidade=mes|ano
+    /clientes/{id}/transacoes?pagina=1&tamanho=100&ordem=date&decrescente=0
+                             &conta=ID&de=AAAA-MM-DD&ate=AAAA-MM-DD&categoria=NOME
+    /clientes/{id}/transacoes.ndjson (mesmos filtros, resposta em streaming)
+
+As transações de exercícios arquivados (arquivo.py) entram nas consultas de
+transações com 'arquivado' igual ao ano e 'posicao' dentro do ano.
+"""
+import argparse
+import asyncio
+import heapq
+import json
+import os
+import threading
+from datetime import datetime
+from itertools import islice
+from operator import itemgetter
+from urllib.parse import urlsplit, parse_qs, unquote
+
+import armazenamento
+import arquivo
+import dados
+
+TAMANHO_PAGINA = 100
+TAMANHO_PAGINA_MAXIMO = 1000
+LINHAS_POR_BLOCO = 500  # linhas do streaming enviadas a cada escrita
+
+
+class ErroConsulta(Exception):
+    """Erro de consulta, convertido em resposta HTTP com o status informado"""
+
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+
+class FonteBase:
+    """Base carregada de arquivo, compartilhada por todas as conexões
+
+    O arquivo só é lido de novo quando é alterado (por exemplo, pelo serviço
+    de ingestão ou pela interface). Como os clientes pertencem só à fonte, os
+    índices de ordenação montados nas consultas ficam em cache por
+    (cliente, coluna) até a próxima recarga.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.mtime = None
+        self.clientes = {}
+        self.indices = {}
+        self.lock = threading.Lock()
+
+    def pasta_arquivo(self):
+        return arquivo.pasta_arquivo(self.caminho)
+
+    def __call__(self):
+        mtime = os.stat(self.caminho).st_mtime_ns if os.path.exists(self.caminho) else None
+        if mtime != self.mtime:
+            with self.lock:
+                if mtime != self.mtime:
+                    self.clientes, _ = armazenamento.carregar_base(self.caminho)
+                    self.indices = {}
+                    self.mtime = mtime
+        return self.clientes
+
+    def obter_indice(self, cliente_id, cliente, ordem):
+        """Índice da coluna do cliente, montado na primeira consulta e mantido em cache"""
+        indices = self.indices
+        chave = (cliente_id, ordem)
+        if chave not in indices:
+            indice = dados.construir_indice(cliente, ordem)
+            # Cliente de uma versão anterior à última recarga não entra no cache
+            if self.clientes.get(cliente_id) is not cliente:
+                return indice
+            indices[chave] = indice
+        return indices[chave]
+
+
+def indice_cliente(cliente_id, cliente, ordem):
+    """Índice da coluna: o do cliente, se existir, ou um montado localmente
+
+    O índice local não é guardado no cliente: só a thread da interface altera
+    os clientes (ver FonteBase.obter_indice para o modo sem interface).
+    """
+    indices = cliente.get('indices')
+    return indices[ordem] if indices is not None else dados.construir_indice(cliente, ordem)
+
+
+def para_json(valor):
+    """Serializa datas (datetime/date) no formato ISO"""
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()
+    return str(valor)
+
+
+def total_transacoes(cliente):
+    return sum(len(conta['transactions']) for conta in list(cliente.get('contas', {}).values()))
+
+
+def resumo_conta(conta_id, conta):
+    return {
+        'id': conta_id,
+        'banco': conta['banco'],
+        'numero': conta['numero'],
+        'inicio': conta['periodos']['inicio'],
+        'fim': conta['periodos']['fim'],
+        'transacoes': len(conta['transactions']),
+        'arquivados': sorted(conta.get('arquivados', {}))
+    }
+
+
+def parametro_data(parametros, nome):
+    if nome not in parametros:
+        return None
+    try:
+        return datetime.strptime(parametros[nome], '%Y-%m-%d').date()
+    except ValueError:
+        raise ErroConsulta(400, f"Parâmetro '{nome}' deve estar no formato AAAA-MM-DD")
+
+
+def parametro_inteiro(parametros, nome, padrao, minimo=1, maximo=None):
+    try:
+        valor = int(parametros.get(nome, padrao))
+    except ValueError:
+        raise ErroConsulta(400, f"Parâmetro '{nome}' deve ser um número inteiro")
+    if valor < minimo:
+        raise ErroConsulta(400, f"Parâmetro '{nome}' deve ser maior ou igual a {minimo}")
+    return min(valor, maximo) if maximo else valor
+
+
+def filtrar_transacoes(cliente, parametros, cliente_id=None, pasta_raiz=None, obter_indice=indice_cliente):
+    """Percorre as transações do cliente na ordem pedida, aplicando os filtros
+
+    Valida os parâmetros e obtém o índice e as entradas arquivadas na chamada;
+    retorna um gerador de dicionários prontos para serializar, sem montar
+    listas intermediárias das transações vivas. Com `pasta_raiz`, os exercícios
+    arquivados do período pedido também são lidos (ver
+    arquivo.entradas_arquivadas) e combinados na mesma ordem.
+    """
+    ordem = parametros.get('ordem', 'date')
+    if ordem not in dados.COLUNAS_ORDENACAO:
+        raise ErroConsulta(400, f"Ordem inválida: {ordem}")
+
+    conta_filtro = parametros.get('conta')
+    categoria = parametros.get('categoria')
+    de = parametro_data(parametros, 'de')
+    ate = parametro_data(parametros, 'ate')
+    decrescente = parametros.get('decrescente') in ('1', 'true')
+
+    # A referência ao índice é uma fotografia: alterações criam uma nova lista
+    indice = obter_indice(cliente_id, cliente, ordem)
+    if decrescente:
+        indice = reversed(indice)
+    entradas = ((chave, conta_id, None, pos, None) for chave, conta_id, pos in indice)
+
+    if pasta_raiz:
+        arquivadas = arquivo.entradas_arquivadas(
+            pasta_raiz, cliente_id, cliente, ordem, conta_filtro, de, ate, decrescente)
+        entradas = heapq.merge(arquivadas, entradas, key=itemgetter(0), reverse=decrescente)
+
+    return gerar_transacoes(cliente, entradas, conta_filtro, categoria, de, ate)
+
+
+def gerar_transacoes(cliente, entradas, conta_filtro, categoria, de, ate):
+    contas = cliente.get('contas', {})
+    for _, conta_id, ano, pos, trans in entradas:
+        if conta_filtro and conta_id != conta_filtro:
+            continue
+
+        if trans is None:
+            conta = contas.get(conta_id)
+            if conta is None or pos >= len(conta['transactions']):
+                continue  # Removida depois da fotografia do índice
+            trans = conta['transactions'][pos]
+
+        if categoria and trans['category'] != categoria:
+            continue
+        if de or ate:
+            dia = arquivo.dia(trans['date'])
+            if (de and dia < de) or (ate and dia > ate):
+                continue
+
+        yield {
+            'conta': conta_id,
+            'arquivado': ano,
+            'posicao': pos,
+            'data': trans['date'],
+            'valor': trans['amount'],
+            'tipo': trans['type'],
+            'descricao': trans['memo'],
+            'categoria': trans['category']
+        }
+
+
+def paginar_transacoes(cliente, parametros, cliente_id=None, pasta_raiz=None, obter_indice=indice_cliente):
+    """Retorna uma página das transações filtradas"""
+    pagina = parametro_inteiro(parametros, 'pagina', 1)
+    tamanho = parametro_inteiro(parametros, 'tamanho', TAMANHO_PAGINA, maximo=TAMANHO_PAGINA_MAXIMO)
+
+    # Lê um item a mais apenas para saber se há próxima página
+    itens = list(islice(filtrar_transacoes(cliente, parametros, cliente_id, pasta_raiz, obter_indice),
+                        (pagina - 1) * tamanho, pagina * tamanho + 1))
+    return {
+        'pagina': pagina,
+        'tamanho': tamanho,
+        'tem_proxima': len(itens) > tamanho,
+        'itens': itens[:tamanho]
+    }
+
+
+def consolidar_periodos(cliente, granularidade):
+    """Soma receitas, despesas e saldo por mês (AAAA-MM) ou ano (AAAA)"""
+    if granularidade not in ('mes', 'ano'):
+        raise ErroConsulta(400, "Granularidade deve ser 'mes' ou 'ano'")
+    formato = '%Y-%m' if granularidade == 'mes' else '%Y'
+
+    periodos = {}
+    for conta in list(cliente.get('contas', {}).values()):
+        # Exercícios arquivados já trazem a consolidação mensal pronta
+        for resumo in list(conta.get('arquivados', {}).values()):
+            for mes, valores in resumo['meses'].items():
+                periodo = mes if granularidade == 'mes' else mes[:4]
+                if periodo not in periodos:
+                    periodos[periodo] = {'receitas': 0, 'despesas': 0, 'saldo': 0}
+                for chave in ('receitas', 'despesas', 'saldo'):
+                    periodos[periodo][chave] += valores[chave]
+
+        for trans in conta['transactions']:
+            periodo = trans['date'].strftime(formato)
+            if periodo not in periodos:
+                periodos[periodo] = {'receitas': 0, 'despesas': 0, 'saldo': 0}
+            valor = trans['amount']
+            if valor > 0:
+                periodos[periodo]['receitas'] += valor
+            else:
+                periodos[periodo]['despesas'] += abs(valor)
+            periodos[periodo]['saldo'] += valor
+
+    return dict(sorted(periodos.items()))
+
+
+class ServidorConsulta:
+    """Servidor HTTP/JSON assíncrono de leitura sobre os clientes
+
+    `obter_clientes` é chamado a cada requisição e deve retornar o dicionário
+    de clientes atual (por exemplo, lambda: app.clientes). `obter_pasta_arquivo`,
+    se informado, retorna a pasta do arquivo de exercícios (ou None), e
+    `obter_indice` substitui indice_cliente (ex.: FonteBase.obter_indice).
+    """
+
+    def __init__(self, obter_clientes, host='127.0.0.1', porta=8765, obter_pasta_arquivo=None,
+                 obter_indice=None):
+        self.obter_clientes = obter_clientes
+        self.obter_pasta_arquivo = obter_pasta_arquivo or (lambda: None)
+        self.obter_indice = obter_indice or indice_cliente
+        self.host = host
+        self.porta = porta
+        self.loop = None
+        self.servidor = None
+        self.thread = None
+
+    async def iniciar(self):
+        self.servidor = await asyncio.start_server(self.atender_conexao, self.host, self.porta)
+        # Com porta 0 o sistema escolhe uma porta livre
+        self.porta = self.servidor.sockets[0].getsockname()[1]
+
+    async def servir(self):
+        await self.iniciar()
+        async with self.servidor:
+            await self.servidor.serve_forever()
+
+    def iniciar_em_thread(self):
+        """Inicia o servidor em uma thread de fundo e retorna a porta em uso"""
+        pronto = threading.Event()
+        erros = []
+
+        def executar():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            try:
+                self.loop.run_until_complete(self.iniciar())
+            except Exception as e:
+                erros.append(e)
+                pronto.set()
+                return
+            pronto.set()
+            try:
+                self.loop.run_forever()
+            finally:
+                # Encerra as conexões ainda abertas antes de fechar o laço
+                pendentes = asyncio.all_tasks(self.loop)
+                for tarefa in pendentes:
+                    tarefa.cancel()
+                self.loop.run_until_complete(asyncio.gather(*pendentes, return_exceptions=True))
+                self.loop.close()
+
+        self.thread = threading.Thread(target=executar, name='servidor-consulta', daemon=True)
+        self.thread.start()
+        pronto.wait()
+        if erros:
+            raise erros[0]
+        return self.porta
+
+    def parar(self):
+        if self.loop and self.servidor:
+            self.loop.call_soon_threadsafe(self.servidor.close)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def atender_conexao(self, reader, writer):
+        """Atende requisições em sequência na mesma conexão (keep-alive)"""
+        try:
+            while True:
+                linha = await reader.readline()
+                if not linha:
+                    break
+
+                cabecalhos = {}
+                while True:
+                    cabecalho = await reader.readline()
+                    if cabecalho in (b'\r\n', b'\n', b''):
+                        break
+                    nome, _, valor = cabecalho.decode('latin-1').partition(':')
+                    cabecalhos[nome.strip().lower()] = valor.strip()
+
+                partes = linha.decode('latin-1').split()
+                manter = cabecalhos.get('connection', '').lower() != 'close'
+                if len(partes) != 3:
+                    await self.responder(writer, 400, {'erro': "Requisição inválida"}, False)
+                    break
+
+                metodo, alvo, _ = partes
+                if metodo != 'GET':
+                    await self.responder(writer, 405, {'erro': "Apenas GET é suportado"}, manter)
+                else:
+                    await self.rotear(writer, alvo, manter)
+
+                if not manter:
+                    break
+
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def rotear(self, writer, alvo, manter):
+        url = urlsplit(alvo)
+        partes = [unquote(p) for p in url.path.strip('/').split('/') if p]
+        parametros = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        try:
+            clientes = self.obter_clientes()
+            if partes == ['clientes']:
+                corpo = [
+                    {
+                        'id': cliente_id,
+                        'nome': cliente['nome'],
+                        'contas': len(cliente.get('contas', {})),
+                        'transacoes': total_transacoes(cliente),
+                        'saldo': cliente['balance_data']['saldo']
+                    }
+                    for cliente_id, cliente in list(clientes.items())
+                ]
+                await self.responder(writer, 200, corpo, manter)
+                return
+
+            if len(partes) < 2 or partes[0] != 'clientes':
+                raise ErroConsulta(404, "Rota não encontrada")
+
+            cliente = clientes.get(partes[1])
+            if cliente is None:
+                raise ErroConsulta(404, f"Cliente {partes[1]} não encontrado")
+            recurso = partes[2] if len(partes) > 2 else None
+            if len(partes) > 3:
+                raise ErroConsulta(404, "Rota não encontrada")
+
+            if recurso is None:
+                corpo = {
+                    'id': partes[1],
+                    'nome': cliente['nome'],
+                    'transacoes': total_transacoes(cliente),
+                    'balanco': cliente['balance_data'],
+                    'contas': [resumo_conta(i, c) for i, c in list(cliente.get('contas', {}).items())]
+                }
+            elif recurso == 'contas':
+                corpo = [resumo_conta(i, c) for i, c in list(cliente.get('contas', {}).items())]
+            elif recurso == 'balanco':
+                corpo = cliente['balance_data']
+            elif recurso == 'periodos':
+                # Consultas que percorrem todas as transações rodam fora do laço,
+                # para que as demais conexões continuem sendo atendidas
+                corpo = await asyncio.get_running_loop().run_in_executor(
+                    None, consolidar_periodos, cliente, parametros.get('granularidade', 'mes'))
+            elif recurso == 'transacoes':
+                corpo = await asyncio.get_running_loop().run_in_executor(
+                    None, paginar_transacoes, cliente, parametros, partes[1], self.obter_pasta_arquivo(),
+                    self.obter_indice)
+            elif recurso == 'transacoes.ndjson':
+                # Índice e arquivo são preparados fora do laço, antes do cabeçalho
+                itens = await asyncio.get_running_loop().run_in_executor(
+                    None, filtrar_transacoes, cliente, parametros, partes[1], self.obter_pasta_arquivo(),
+                    self.obter_indice)
+                await self.responder_stream(writer, itens, manter)
+                return
+            else:
+                raise ErroConsulta(404, "Rota não encontrada")
+
+            await self.responder(writer, 200, corpo, manter)
+
+        except ErroConsulta as e:
+            await self.responder(writer, e.status, {'erro': str(e)}, manter)
+        except ConnectionError:
+            raise
+        except Exception as e:
+            await self.responder(writer, 500, {'erro': str(e)}, manter)
+
+    async def responder(self, writer, status, corpo, manter):
+        conteudo = json.dumps(corpo, default=para_json, ensure_ascii=False).encode('utf-8')
+        writer.write(
+            f"HTTP/1.1 {status} {MOTIVOS.get(status, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(conteudo)}\r\n"
+            f"Connection: {'keep-alive' if manter else 'close'}\r\n\r\n".encode('latin-1')
+        )
+        writer.write(conteudo)
+        await writer.drain()
+
+    async def responder_stream(self, writer, itens, manter):
+        """Envia os itens como NDJSON com Transfer-Encoding: chunked
+
+        Os blocos são lidos do gerador fora do laço (run_in_executor), um de
+        cada vez, para que a leitura não bloqueie as demais conexões.
+        """
+        loop = asyncio.get_running_loop()
+
+        def ler_bloco():
+            return list(islice(itens, LINHAS_POR_BLOCO))
+
+        # O primeiro bloco é lido antes do cabeçalho de sucesso, para que erros ainda virem resposta
+        bloco = await loop.run_in_executor(None, ler_bloco)
+
+        writer.write(
+            "HTTP/1.1 200 OK\r\n"
+            "Content-Type: application/x-ndjson; charset=utf-8\r\n"
+            "Transfer-Encoding: chunked\r\n"
+            f"Connection: {'keep-alive' if manter else 'close'}\r\n\r\n".encode('latin-1')
+        )
+
+        try:
+            while bloco:
+                await self.enviar_bloco(writer, bloco)
+                if len(bloco) < LINHAS_POR_BLOCO:
+                    break
+                bloco = await loop.run_in_executor(None, ler_bloco)
+        except ConnectionError:
+            raise
+        except Exception as e:
+            # O cabeçalho já foi enviado: só resta interromper a conexão
+            raise ConnectionAbortedError(str(e))
+
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def enviar_bloco(self, writer, bloco):
+        conteudo = ''.join(json.dumps(item, default=para_json, ensure_ascii=False) + '\n' for item in bloco)
+        conteudo = conteudo.encode('utf-8')
+        writer.write(f"{len(conteudo):X}\r\n".encode('latin-1') + conteudo + b"\r\n")
+        # Aguarda o cliente consumir e libera o laço para outras conexões
+        await writer.drain()
+
+
+MOTIVOS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    500: 'Internal Server Error'
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API local de consulta aos clientes")
+    parser.add_argument('--base', required=True, help="Arquivo da base de clientes")
+    parser.add_argument('--porta', type=int, default=8765, help="Porta em 127.0.0.1")
+    args = parser.parse_args()
+
+    fonte = FonteBase(args.base)
+    servidor = ServidorConsulta(fonte, porta=args.porta, obter_pasta_arquivo=fonte.pasta_arquivo,
+                                obter_indice=fonte.obter_indice)
+    print(f"API disponível em http://127.0.0.1:{args.porta}/clientes")
+    try:
+        asyncio.run(servidor.servir())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
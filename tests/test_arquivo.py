@@ -0,0 +1,122 @@
+"""Verificações da leitura dos exercícios arquivados (arquivo.py)
+
+Uso:
+    python -m pytest tests
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import date, datetime
+from itertools import islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import arquivo  # noqa: E402
+import dados  # noqa: E402
+
+
+def novo_cliente(quantidade, anos, semente=1):
+    aleatorio = random.Random(semente)
+    cliente = {'nome': 'Cliente', 'balance_data': dados.balanco_vazio(), 'contas': {}}
+    for conta_id in ('1', '2'):
+        cliente['contas'][conta_id] = {
+            'banco': 'Banco',
+            'numero': conta_id,
+            'transactions': [],
+            'periodos': {'inicio': None, 'fim': None}
+        }
+        dados.aplicar_transacoes(cliente, conta_id, [
+            {
+                'date': datetime(aleatorio.choice(anos), aleatorio.randint(1, 12), aleatorio.randint(1, 28)),
+                'amount': round(aleatorio.uniform(-100, 100), 2),
+                'type': 'DEBIT',
+                'memo': f"Item {i}",
+                'category': aleatorio.choice(['A', 'B', 'C'])
+            }
+            for i in range(quantidade)
+        ])
+    return cliente
+
+
+class TestEntradasArquivadas(unittest.TestCase):
+
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp()
+        self.cliente = novo_cliente(300, [2021, 2022, 2023])
+        self.originais = {
+            conta_id: list(conta['transactions']) for conta_id, conta in self.cliente['contas'].items()
+        }
+        for conta_id in self.cliente['contas']:
+            arquivo.arquivar_conta(self.pasta, '1', self.cliente, conta_id, 2022)
+
+    def tearDown(self):
+        shutil.rmtree(self.pasta, ignore_errors=True)
+
+    def entradas(self, **filtros):
+        return list(arquivo.entradas_arquivadas(self.pasta, '1', self.cliente, **filtros))
+
+    def arquivadas(self, conta_id=None):
+        return [
+            trans for id_conta, transacoes in self.originais.items()
+            if conta_id is None or id_conta == conta_id
+            for trans in transacoes if trans['date'].year <= 2022
+        ]
+
+    def test_ordem_de_data_com_todas_as_contas(self):
+        entradas = self.entradas()
+        self.assertEqual(len(entradas), len(self.arquivadas()))
+        self.assertEqual({e[1] for e in entradas}, {'1', '2'})
+        datas = [e[0] for e in entradas]
+        self.assertEqual(datas, sorted(datas))
+
+        datas = [e[0] for e in self.entradas(decrescente=True)]
+        self.assertEqual(datas, sorted(datas, reverse=True))
+
+    def test_outras_colunas(self):
+        valores = [e[0] for e in self.entradas(coluna='amount', conta_id='2')]
+        self.assertEqual(valores, sorted(abs(t['amount']) for t in self.arquivadas('2')))
+
+    def test_periodo_le_apenas_as_linhas_do_intervalo(self):
+        entradas = self.entradas(de=date(2022, 3, 1), ate=date(2022, 3, 31))
+        esperadas = [t for t in self.arquivadas() if (t['date'].year, t['date'].month) == (2022, 3)]
+        self.assertEqual(len(entradas), len(esperadas))
+        self.assertTrue(all(e[2] == 2022 for e in entradas))
+
+    def test_pagina_nao_le_o_historico_inteiro(self):
+        lidas = []
+        original = arquivo.AnoArquivado.__getitem__
+
+        def contar(ano, pos):
+            lidas.append(pos)
+            return original(ano, pos)
+
+        arquivo.AnoArquivado.__getitem__ = contar
+        try:
+            primeiras = list(islice(arquivo.entradas_arquivadas(self.pasta, '1', self.cliente), 10))
+        finally:
+            arquivo.AnoArquivado.__getitem__ = original
+
+        self.assertEqual(len(primeiras), 10)
+        self.assertLess(len(lidas), 20)
+
+    def test_gravar_ano_ordena_por_data(self):
+        conta = self.cliente['contas']['1']
+        transacoes = [t for t in self.originais['1'] if t['date'].year == 2021]
+        transacoes.sort(key=lambda t: t['amount'])
+        pasta = arquivo.pasta_ano(self.pasta, '1', '1', 2021)
+        arquivo.gravar_ano(pasta, transacoes)
+        with arquivo.AnoArquivado(pasta) as linhas:
+            self.assertEqual([t['date'] for t in linhas], sorted(t['date'] for t in transacoes))
+
+        # Anos arquivados por versões anteriores não têm a marca de ordem e são ordenados na leitura
+        del conta['arquivados'][2021]['ordenado']
+        datas = [e[0] for e in self.entradas(conta_id='1')]
+        self.assertEqual(datas, sorted(datas))
+        self.assertEqual(len(datas), len(self.arquivadas('1')))
+
+
+if __name__ == "__main__":
+    unittest.main()
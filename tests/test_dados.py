@@ -0,0 +1,88 @@
+"""Verificações do ranking de categorias (dados.py)
+
+Uso:
+    python -m pytest tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dados  # noqa: E402
+
+
+def balanco(categorias):
+    balance_data = dados.balanco_vazio()
+    dados.somar_categorias(balance_data, categorias)
+    return balance_data
+
+
+class TestRankingCategorias(unittest.TestCase):
+
+    def test_top_n_por_valor_absoluto(self):
+        totais = {'A': 10.0, 'B': -50.0, 'C': 30.0, 'D': 5.0}
+        itens, outros = dados.ranking_categorias(totais, 2)
+        self.assertEqual(itens, [('B', -50.0), ('C', 30.0)])
+        self.assertEqual(outros, {'valor': 15.0, 'quantidade': 2})
+
+    def test_sem_outros_quando_cabem_todas(self):
+        itens, outros = dados.ranking_categorias({'A': 1.0, 'B': 2.0}, 2)
+        self.assertEqual(itens, [('B', 2.0), ('A', 1.0)])
+        self.assertIsNone(outros)
+
+    def test_categorias_zeradas_sao_omitidas(self):
+        itens, outros = dados.ranking_categorias({'A': 1.0, 'B': 0.0, 'C': 0.001}, 1)
+        self.assertEqual(itens, [('A', 1.0)])
+        self.assertIsNone(outros)
+
+    def test_outros_em_cada_nivel(self):
+        ranking = dados.ranking_hierarquico(balanco({
+            'Despesas:Impostos': -30.0,
+            'Despesas:Aluguel': -100.0,
+            'Despesas:Luz': -5.0,
+            'Receitas': 200.0
+        }), 2)
+        self.assertEqual([item['nome'] for item in ranking['itens']], ['Receitas', 'Despesas'])
+        self.assertIsNone(ranking['outros'])
+
+        despesas = ranking['itens'][1]
+        self.assertEqual(despesas['valor'], -135.0)
+        self.assertEqual([item['rotulo'] for item in despesas['itens']], ['Aluguel', 'Impostos'])
+        self.assertEqual(despesas['outros'], {'valor': -5.0, 'quantidade': 1})
+
+    def test_pai_com_subcategorias_que_se_anulam(self):
+        balance_data = balanco({
+            'Transferencias:Entrada': 500.0,
+            'Transferencias:Saida': -500.0,
+            'Receitas': 100.0
+        })
+        linhas = list(dados.percorrer_ranking(dados.ranking_hierarquico(balance_data)))
+        self.assertEqual(linhas, [
+            (0, 'Receitas', 100.0, 'Receitas'),
+            (0, 'Transferencias', 0.0, 'Transferencias'),
+            (1, 'Entrada', 500.0, 'Transferencias:Entrada'),
+            (1, 'Saida', -500.0, 'Transferencias:Saida')
+        ])
+
+    def test_pai_zerado_conta_em_outros(self):
+        balance_data = balanco({
+            'A:X': 1.0, 'A:Y': -1.0,
+            'B': 10.0,
+            'C': 20.0
+        })
+        ranking = dados.ranking_hierarquico(balance_data, 2)
+        self.assertEqual([item['nome'] for item in ranking['itens']], ['C', 'B'])
+        self.assertEqual(ranking['outros'], {'valor': 0.0, 'quantidade': 1})
+
+    def test_subarvore_sem_valor_e_omitida(self):
+        # Ex.: importação desfeita, com todas as subcategorias de volta a zero
+        balance_data = balanco({'A:X': 5.0, 'B': 1.0})
+        dados.somar_categorias(balance_data, {'A:X': -5.0})
+        ranking = dados.ranking_hierarquico(balance_data)
+        self.assertEqual([item['nome'] for item in ranking['itens']], ['B'])
+        self.assertIsNone(ranking['outros'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+"""Verificações de desfazer/refazer (historico.py)
+
+Uso:
+    python -m pytest tests
+"""
+import os
+import sys
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dados  # noqa: E402
+import historico  # noqa: E402
+
+
+def transacao(dia, valor, categoria, mes=1):
+    return {
+        'date': datetime(2024, mes, dia),
+        'amount': valor,
+        'type': 'CREDIT' if valor > 0 else 'DEBIT',
+        'memo': f"Item {mes}-{dia}",
+        'category': categoria,
+        'fitid': f"{mes}-{dia}"
+    }
+
+
+def novo_cliente():
+    cliente = {'nome': 'Cliente', 'balance_data': dados.balanco_vazio(), 'contas': {}}
+    for conta_id, transacoes in (
+        ('1', [transacao(3, 1200.10, 'Receitas:Salario'), transacao(5, -89.90, 'Despesas:Luz'),
+               transacao(7, -1500.00, 'Despesas:Aluguel')]),
+        ('2', [transacao(2, -35.45, 'Despesas:Luz'), transacao(9, 250.00, 'Receitas')])
+    ):
+        cliente['contas'][conta_id] = {
+            'banco': 'Banco',
+            'numero': conta_id,
+            'transactions': [],
+            'periodos': {'inicio': None, 'fim': None}
+        }
+        dados.aplicar_transacoes(cliente, conta_id, transacoes)
+    return cliente
+
+
+def totais(valores):
+    """Totais arredondados, sem as categorias que voltaram a zero"""
+    arredondados = {chave: round(valor, 2) for chave, valor in valores.items()}
+    return {chave: valor for chave, valor in arredondados.items() if valor}
+
+
+def estado(cliente):
+    """Fotografia do que desfazer/refazer deve restaurar"""
+    balance_data = cliente['balance_data']
+    return {
+        'balanco': {chave: round(balance_data[chave], 2) for chave in ('receitas', 'despesas', 'saldo')},
+        'categorias': totais(balance_data['categorias']),
+        'hierarquia': totais(balance_data['hierarquia']),
+        'indices': {coluna: list(indice) for coluna, indice in dados.obter_indices(cliente).items()},
+        'contas': {
+            conta_id: {
+                'transacoes': [dict(t) for t in conta['transactions']],
+                'periodos': dict(conta['periodos']),
+                'ultima_importacao': conta.get('ultima_importacao')
+            }
+            for conta_id, conta in cliente['contas'].items()
+        }
+    }
+
+
+class TestDesfazerRefazer(unittest.TestCase):
+
+    def setUp(self):
+        self.clientes = {'1': novo_cliente()}
+        self.cliente = self.clientes['1']
+        self.historico = historico.Historico()
+
+    def verificar_ciclo(self, antes, depois):
+        """Desfaz e refaz duas vezes, comparando com os estados antes e depois da operação"""
+        for _ in range(2):
+            self.assertIsNotNone(self.historico.desfazer(self.clientes))
+            self.assertEqual(estado(self.cliente), antes)
+            self.assertIsNotNone(self.historico.refazer(self.clientes))
+            self.assertEqual(estado(self.cliente), depois)
+
+    def test_importacao(self):
+        conta = self.cliente['contas']['1']
+        conta['ultima_importacao'] = datetime(2024, 1, 10, 8, 30)
+        antes = estado(self.cliente)
+
+        periodos_anteriores = dict(conta['periodos'])
+        inicio = dados.aplicar_transacoes(self.cliente, '1', [
+            transacao(1, -12.30, 'Despesas:Mercado:Feira', mes=2),
+            transacao(4, 99.99, 'Receitas:Extra', mes=2),
+            transacao(1, -20.00, 'Despesas:Luz')
+        ])
+        self.historico.registrar(historico.Importacao(
+            '1', '1', inicio, periodos_anteriores, datetime(2024, 1, 10, 8, 30)))
+        depois = estado(self.cliente)
+        self.assertNotEqual(antes['contas']['1']['periodos'], depois['contas']['1']['periodos'])
+
+        self.verificar_ciclo(antes, depois)
+        # Os identificadores (FITID) acompanham as transações refeitas
+        self.assertEqual(dados.transacoes_novas(conta, conta['transactions']), [])
+
+    def test_remocao_de_conta(self):
+        antes = estado(self.cliente)
+        conta = dados.remover_conta(self.cliente, '2')
+        self.historico.registrar(historico.RemocaoConta('1', '2', conta))
+        depois = estado(self.cliente)
+        self.assertNotIn('2', depois['contas'])
+
+        self.verificar_ciclo(antes, depois)
+
+    def test_edicao_de_categoria(self):
+        antes = estado(self.cliente)
+        anteriores = dados.alterar_categorias(
+            self.cliente, [('1', 1, 'Despesas:Casa:Energia'), ('2', 0, 'Despesas:Casa:Energia')])
+        self.historico.registrar(historico.EdicaoCategoria('1', 'Despesas:Casa:Energia', [
+            ('1', 1, anteriores[0]), ('2', 0, anteriores[1])]))
+        depois = estado(self.cliente)
+        self.assertNotIn('Despesas:Luz', depois['hierarquia'])
+        self.assertAlmostEqual(depois['hierarquia']['Despesas:Casa'], -125.35)
+
+        self.verificar_ciclo(antes, depois)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+"""Verificações do serviço de ingestão contínua (ingestao.py)
+
+Uso:
+    python -m pytest tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import armazenamento  # noqa: E402
+import dados  # noqa: E402
+import ingestao  # noqa: E402
+
+CABECALHO_OFX = """OFXHEADER:100
+DATA:OFXSGML
+VERSION:102
+SECURITY:NONE
+ENCODING:USASCII
+CHARSET:1252
+COMPRESSION:NONE
+OLDFILEUID:NONE
+NEWFILEUID:NONE
+
+"""
+
+
+def conteudo_ofx(numero, quantidade, prefixo='T'):
+    transacoes = ''.join(
+        f"<STMTTRN><TRNTYPE>OTHER<DTPOSTED>202401{i % 28 + 1:02d}<TRNAMT>{(i + 1) * 10:.2f}"
+        f"<FITID>{prefixo}-{i}<MEMO>Item {i}</STMTTRN>\n"
+        for i in range(quantidade)
+    )
+    return CABECALHO_OFX + (
+        "<OFX><SIGNONMSGSRSV1><SONRS><STATUS><CODE>0<SEVERITY>INFO</STATUS>"
+        "<DTSERVER>20240201<LANGUAGE>POR</SONRS></SIGNONMSGSRSV1>\n"
+        "<BANKMSGSRSV1><STMTTRNRS><TRNUID>1<STATUS><CODE>0<SEVERITY>INFO</STATUS><STMTRS><CURDEF>BRL"
+        f"<BANKACCTFROM><BANKID>001<ACCTID>{numero}<ACCTTYPE>CHECKING</BANKACCTFROM>\n"
+        f"<BANKTRANLIST><DTSTART>20240101<DTEND>20240131\n{transacoes}</BANKTRANLIST>"
+        "<LEDGERBAL><BALAMT>0<DTASOF>20240131</LEDGERBAL></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n"
+    )
+
+
+def novo_cliente(nome, numero):
+    return {
+        'nome': nome,
+        'balance_data': dados.balanco_vazio(),
+        'contas': {
+            '1': {
+                'banco': 'Banco',
+                'numero': numero,
+                'transactions': [],
+                'periodos': {'inicio': None, 'fim': None}
+            }
+        }
+    }
+
+
+class TestServicoIngestao(unittest.TestCase):
+
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp()
+        self.entrada = os.path.join(self.pasta, 'entrada')
+        os.mkdir(self.entrada)
+        self.caminho_base = os.path.join(self.pasta, 'base.pkl')
+        armazenamento.salvar_base(self.caminho_base, {'1': novo_cliente('Cliente', '12345-6')})
+        self.executor = ThreadPoolExecutor(max_workers=2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+        shutil.rmtree(self.pasta, ignore_errors=True)
+
+    def gravar(self, nome, quantidade, idade=60):
+        """Grava um OFX na pasta monitorada com mtime antigo o suficiente para ser lido"""
+        caminho = os.path.join(self.entrada, nome)
+        with open(caminho, 'w') as file:
+            file.write(conteudo_ofx('12345-6', quantidade))
+        instante = time.time() - idade
+        os.utime(caminho, (instante, instante))
+
+    def servico(self):
+        return ingestao.ServicoIngestao(self.entrada, self.caminho_base)
+
+    def transacoes_na_base(self):
+        clientes, _ = armazenamento.carregar_base(self.caminho_base)
+        return clientes['1']['contas']['1']['transactions']
+
+    def test_importa_e_retoma_pelo_checkpoint(self):
+        self.gravar('a.ofx', 5)
+        servico = self.servico()
+        self.assertEqual(servico.processar_pendentes(self.executor), 5)
+        self.assertEqual(servico.checkpoint['a.ofx']['importadas'], 5)
+
+        # Sem alterações na pasta, nada é reaplicado
+        self.assertEqual(servico.processar_pendentes(self.executor), 0)
+
+        # Um novo serviço (reinicialização) retoma do checkpoint gravado na base
+        self.assertEqual(self.servico().processar_pendentes(self.executor), 0)
+        self.assertEqual(len(self.transacoes_na_base()), 5)
+
+    def test_arquivo_regravado_importa_apenas_as_novas(self):
+        self.gravar('a.ofx', 5)
+        self.servico().processar_pendentes(self.executor)
+
+        self.gravar('a.ofx', 6, idade=30)
+        servico = self.servico()
+        self.assertEqual(servico.processar_pendentes(self.executor), 1)
+        self.assertEqual(servico.checkpoint['a.ofx']['importadas'], 1)
+        self.assertEqual(len(self.transacoes_na_base()), 6)
+
+    def test_arquivo_recente_aguarda_estabilidade(self):
+        self.gravar('a.ofx', 5, idade=0)
+        self.assertEqual(self.servico().processar_pendentes(self.executor), 0)
+
+    def test_base_alterada_durante_o_lote_e_reaplicada(self):
+        self.gravar('a.ofx', 5)
+        servico = self.servico()
+
+        # Outro processo (ex.: a interface) importa o mesmo arquivo e renomeia o cliente
+        clientes, checkpoint = armazenamento.carregar_base(self.caminho_base)
+        clientes['1']['nome'] = 'Renomeado'
+        lidas = ingestao.ler_ofx(os.path.join(self.entrada, 'a.ofx'))['contas'][0][1]
+        dados.aplicar_transacoes(clientes['1'], '1', lidas[:3])
+        armazenamento.salvar_base(self.caminho_base, clientes, checkpoint)
+        mtime = os.stat(self.caminho_base).st_mtime_ns + 1_000_000_000
+        os.utime(self.caminho_base, ns=(mtime, mtime))
+
+        with self.assertLogs('ingestao', level='INFO') as registros:
+            self.assertEqual(servico.processar_pendentes(self.executor), 2)
+        self.assertTrue(any('reaplicando' in linha for linha in registros.output))
+
+        clientes, checkpoint = armazenamento.carregar_base(self.caminho_base)
+        self.assertEqual(clientes['1']['nome'], 'Renomeado')
+        self.assertEqual(
+            sorted(t['fitid'] for t in clientes['1']['contas']['1']['transactions']),
+            [f"T-{i}" for i in range(5)])
+        self.assertEqual(checkpoint['a.ofx']['importadas'], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
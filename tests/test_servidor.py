@@ -0,0 +1,210 @@
+"""Verificações da API local de consulta (servidor.py) em 127.0.0.1
+
+Uso:
+    python -m pytest tests
+    python -m unittest discover tests
+"""
+import http.client
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import armazenamento  # noqa: E402
+import arquivo  # noqa: E402
+import dados  # noqa: E402
+import servidor  # noqa: E402
+
+
+def transacao(dia, valor, categoria='Outros', ano=2024):
+    return {
+        'date': datetime(ano, 1, dia),
+        'amount': valor,
+        'type': 'CREDIT' if valor > 0 else 'DEBIT',
+        'memo': f"Item {dia}",
+        'category': categoria
+    }
+
+
+def novo_cliente(nome, contas):
+    cliente = {'nome': nome, 'balance_data': dados.balanco_vazio(), 'contas': {}}
+    for conta_id, transacoes in contas.items():
+        cliente['contas'][conta_id] = {
+            'banco': 'Banco',
+            'numero': conta_id,
+            'transactions': [],
+            'periodos': {'inicio': None, 'fim': None}
+        }
+        dados.aplicar_transacoes(cliente, conta_id, transacoes)
+    # Como em uma base recém-carregada: sem índices em cache
+    cliente.pop('indices', None)
+    return cliente
+
+
+class TestServidorConsulta(unittest.TestCase):
+
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp()
+        self.clientes = {
+            '1': novo_cliente('Cliente A', {
+                '1': [transacao(dia, dia * 10.0) for dia in range(1, 6)],
+                '2': [transacao(dia, -dia * 1.0, 'Impostos') for dia in range(1, 4)]
+            }),
+            '2': novo_cliente('Cliente B', {'1': [transacao(1, -50.0)]})
+        }
+        self.api = servidor.ServidorConsulta(
+            lambda: self.clientes, porta=0, obter_pasta_arquivo=lambda: self.pasta)
+        self.porta = self.api.iniciar_em_thread()
+        self.conexao = http.client.HTTPConnection('127.0.0.1', self.porta, timeout=10)
+
+    def tearDown(self):
+        self.conexao.close()
+        self.api.parar()
+        self.api.thread.join(timeout=5)
+        shutil.rmtree(self.pasta, ignore_errors=True)
+
+    def consultar(self, caminho, metodo='GET'):
+        self.conexao.request(metodo, caminho)
+        resposta = self.conexao.getresponse()
+        return resposta, resposta.read()
+
+    def consultar_json(self, caminho):
+        resposta, corpo = self.consultar(caminho)
+        return resposta.status, json.loads(corpo)
+
+    def test_rotas_de_clientes(self):
+        status, corpo = self.consultar_json('/clientes')
+        self.assertEqual(status, 200)
+        self.assertEqual([c['id'] for c in corpo], ['1', '2'])
+        self.assertEqual(corpo[0]['transacoes'], 8)
+
+        status, corpo = self.consultar_json('/clientes/1')
+        self.assertEqual(status, 200)
+        self.assertEqual(corpo['nome'], 'Cliente A')
+        self.assertEqual(len(corpo['contas']), 2)
+
+        status, corpo = self.consultar_json('/clientes/1/balanco')
+        self.assertEqual(status, 200)
+        self.assertAlmostEqual(corpo['saldo'], 144.0)
+
+        status, corpo = self.consultar_json('/clientes/1/periodos?granularidade=ano')
+        self.assertEqual(status, 200)
+        self.assertAlmostEqual(corpo['2024']['receitas'], 150.0)
+        self.assertAlmostEqual(corpo['2024']['despesas'], 6.0)
+
+    def test_paginacao(self):
+        status, pagina = self.consultar_json('/clientes/1/transacoes?tamanho=3&ordem=amount&decrescente=1')
+        self.assertEqual(status, 200)
+        self.assertTrue(pagina['tem_proxima'])
+        self.assertEqual([t['valor'] for t in pagina['itens']], [50.0, 40.0, 30.0])
+
+        status, pagina = self.consultar_json('/clientes/1/transacoes?tamanho=3&pagina=3&ordem=amount&decrescente=1')
+        self.assertEqual(status, 200)
+        self.assertFalse(pagina['tem_proxima'])
+        self.assertEqual([t['valor'] for t in pagina['itens']], [-2.0, -1.0])
+
+        status, pagina = self.consultar_json('/clientes/1/transacoes?conta=2&categoria=Impostos&ate=2024-01-02')
+        self.assertEqual(status, 200)
+        self.assertEqual([t['valor'] for t in pagina['itens']], [-1.0, -2.0])
+
+    def test_consulta_nao_guarda_indices_no_cliente(self):
+        self.consultar_json('/clientes/1/transacoes')
+        self.assertNotIn('indices', self.clientes['1'])
+
+    def test_streaming_ndjson(self):
+        resposta, corpo = self.consultar('/clientes/1/transacoes.ndjson?conta=1')
+        self.assertEqual(resposta.status, 200)
+        self.assertEqual(resposta.getheader('Transfer-Encoding'), 'chunked')
+        linhas = [json.loads(linha) for linha in corpo.decode('utf-8').splitlines()]
+        self.assertEqual([t['valor'] for t in linhas], [10.0, 20.0, 30.0, 40.0, 50.0])
+
+        # A mesma conexão continua utilizável depois do streaming (keep-alive)
+        status, _ = self.consultar_json('/clientes')
+        self.assertEqual(status, 200)
+
+    def test_streaming_em_varios_blocos(self):
+        linhas_por_bloco = servidor.LINHAS_POR_BLOCO
+        servidor.LINHAS_POR_BLOCO = 2
+        try:
+            resposta, corpo = self.consultar('/clientes/1/transacoes.ndjson?ordem=amount')
+        finally:
+            servidor.LINHAS_POR_BLOCO = linhas_por_bloco
+        self.assertEqual(resposta.status, 200)
+        self.assertEqual(len(corpo.decode('utf-8').splitlines()), 8)
+
+    def test_exercicios_arquivados(self):
+        cliente = self.clientes['2']
+        dados.aplicar_transacoes(cliente, '1', [transacao(2, 7.0, ano=2023)])
+        arquivo.arquivar_conta(self.pasta, '2', cliente, '1', 2023)
+        cliente.pop('indices', None)
+
+        status, pagina = self.consultar_json('/clientes/2/transacoes')
+        self.assertEqual(status, 200)
+        self.assertEqual([(t['arquivado'], t['valor']) for t in pagina['itens']], [(2023, 7.0), (None, -50.0)])
+
+        status, pagina = self.consultar_json('/clientes/2/transacoes?de=2024-01-01')
+        self.assertEqual([t['valor'] for t in pagina['itens']], [-50.0])
+
+    def test_erros(self):
+        for caminho in ('/clientes/1/periodos?granularidade=semana',
+                        '/clientes/1/transacoes?ordem=memo2',
+                        '/clientes/1/transacoes?de=01-01-2024',
+                        '/clientes/1/transacoes?pagina=0',
+                        '/clientes/1/transacoes.ndjson?ordem=x'):
+            status, corpo = self.consultar_json(caminho)
+            self.assertEqual(status, 400, caminho)
+            self.assertIn('erro', corpo)
+
+        for caminho in ('/clientes/99', '/outra', '/clientes/1/desconhecido', '/clientes/1/contas/1/x'):
+            status, corpo = self.consultar_json(caminho)
+            self.assertEqual(status, 404, caminho)
+            self.assertIn('erro', corpo)
+
+        resposta, _ = self.consultar('/clientes', metodo='POST')
+        self.assertEqual(resposta.status, 405)
+
+
+class TestFonteBase(unittest.TestCase):
+
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp()
+        self.caminho = os.path.join(self.pasta, 'base.pkl')
+        armazenamento.salvar_base(self.caminho, {'1': novo_cliente('A', {'1': [transacao(2, 5.0)]})})
+        self.fonte = servidor.FonteBase(self.caminho)
+
+    def tearDown(self):
+        shutil.rmtree(self.pasta, ignore_errors=True)
+
+    def test_indice_em_cache_ate_a_base_mudar(self):
+        cliente = self.fonte()['1']
+        indice = self.fonte.obter_indice('1', cliente, 'date')
+        self.assertIs(self.fonte.obter_indice('1', self.fonte()['1'], 'date'), indice)
+        self.assertNotIn('indices', cliente)
+
+        clientes = {'1': novo_cliente('A', {'1': [transacao(2, 5.0), transacao(1, 3.0)]})}
+        armazenamento.salvar_base(self.caminho, clientes)
+        mtime = os.stat(self.caminho).st_mtime_ns + 1_000_000_000
+        os.utime(self.caminho, ns=(mtime, mtime))
+
+        novo = self.fonte()['1']
+        self.assertIsNot(novo, cliente)
+        self.assertEqual([pos for _, _, pos in self.fonte.obter_indice('1', novo, 'date')], [1, 0])
+
+    def test_cliente_anterior_a_recarga_nao_entra_no_cache(self):
+        cliente = self.fonte()['1']
+        armazenamento.salvar_base(self.caminho, {'1': novo_cliente('A', {})})
+        mtime = os.stat(self.caminho).st_mtime_ns + 1_000_000_000
+        os.utime(self.caminho, ns=(mtime, mtime))
+        self.fonte()
+
+        self.assertEqual(len(self.fonte.obter_indice('1', cliente, 'date')), 1)
+        self.assertEqual(self.fonte.obter_indice('1', self.fonte()['1'], 'date'), [])
+
+
+if __name__ == "__main__":
+    unittest.main()